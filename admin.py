@@ -1,5 +1,8 @@
 # admin.py
+from datetime import datetime
 from sqladmin import Admin, ModelView
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
 from models import UserProfile, Course, Category, Lesson, Exam, Question, Certificate  # Импортируем модель User
 from database import engine  # Импортируем engine из database.py
 
@@ -8,11 +11,30 @@ class UserAdmin(ModelView, model=UserProfile):
     column_list = [column.name for column in UserProfile.__table__.columns]
 
 
-class CourseAdmin(ModelView, model=Course):
+class SoftDeleteAdmin(ModelView):
+    # Deleting sets deleted_at like the API does; the purger removes the rows later.
+    def list_query(self, request):
+        return select(self.model).where(self.model.deleted_at.is_(None))
+
+    def count_query(self, request):
+        return select(func.count(self.model.id)).where(self.model.deleted_at.is_(None))
+
+    async def delete_model(self, request, pk):
+        await run_in_threadpool(self.soft_delete, int(pk))
+
+    def soft_delete(self, pk: int):
+        with self.session_maker() as session:
+            obj = session.get(self.model, pk)
+            if obj is not None and obj.deleted_at is None:
+                obj.deleted_at = datetime.utcnow()
+                session.commit()
+
+
+class CourseAdmin(SoftDeleteAdmin, model=Course):
     column_list = [column.name for column in Course.__table__.columns]
 
 
-class CategoryAdmin(ModelView, model=Category):
+class CategoryAdmin(SoftDeleteAdmin, model=Category):
     column_list = [column.name for column in Category.__table__.columns]
 
 
@@ -32,7 +54,7 @@ class CertificateAdmin(ModelView, model=Certificate):
     column_list = [column.name for column in Certificate.__table__.columns]
 
 
-def setup_admin(app):
+def setup_admin(app, engine=engine):
     admin = Admin(app, engine)
     admin.add_view(UserAdmin)
     admin.add_view(CourseAdmin)
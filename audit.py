@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import event, insert, inspect, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from database import SessionLocal
+from models import AuditEvent, Course, Lesson, Exam, Certificate
+from tenancy import current_tenant, token_claims
+from config import AUDIT_BUFFER_SIZE, AUDIT_OVERFLOW, AUDIT_BATCH_SIZE, AUDIT_MAX_ATTEMPTS, AUDIT_DEAD_LETTER_DIR
+
+
+logger = logging.getLogger(__name__)
+
+AUDITED_MODELS = (Course, Lesson, Exam, Certificate)
+# Secrets that must not be copied into the log.
+REDACTED_FIELDS = {"verification_code"}
+
+# (actor, source) of the request being handled; jobs outside a request are "system".
+audit_actor: ContextVar[tuple[Optional[str], str]] = ContextVar("audit_actor", default=(None, "system"))
+
+
+def plain(value):
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def stage(db: Session, action: str, model, entity_id: int, changes: Optional[dict] = None,
+          tenant_id: Optional[int] = None):
+    """Queue an event on the session; it reaches the buffer only if the session commits."""
+    actor, source = audit_actor.get()
+    changes = {key: plain(value) for key, value in (changes or {}).items() if key not in REDACTED_FIELDS}
+    db.info.setdefault("audit", []).append({
+        "occurred_at": datetime.utcnow(), "tenant_id": tenant_id or current_tenant.get(), "actor": actor,
+        "source": source, "action": action, "entity": model.__tablename__, "entity_id": entity_id,
+        "changes": changes or None,
+    })
+
+
+def stage_flushed(db: Session, flush_context):
+    for obj in db.new:
+        if isinstance(obj, AUDITED_MODELS):
+            stage(db, "create", type(obj), obj.id,
+                  {column.key: getattr(obj, column.key) for column in inspect(obj).mapper.column_attrs},
+                  getattr(obj, "tenant_id", None))
+    for obj in db.dirty:
+        if isinstance(obj, AUDITED_MODELS) and db.is_modified(obj):
+            changes = {}
+            state = inspect(obj)
+            # Columns only: relationships hold objects, and their foreign keys are columns anyway.
+            for column in state.mapper.column_attrs:
+                attr = state.attrs[column.key]
+                history = attr.history
+                if history.has_changes():
+                    changes[attr.key] = [history.deleted[0] if history.deleted else None,
+                                         history.added[0] if history.added else None]
+            if changes:
+                soft_deleted = "deleted_at" in changes and changes["deleted_at"][1] is not None
+                stage(db, "delete" if soft_deleted else "update", type(obj), obj.id, changes,
+                      getattr(obj, "tenant_id", None))
+    for obj in db.deleted:
+        if isinstance(obj, AUDITED_MODELS):
+            stage(db, "delete", type(obj), obj.id)
+
+
+class AuditLog:
+    """Audit events held in a bounded in-memory buffer and written in batches.
+
+    Events are staged on the session by ORM flush hooks (which cover both the
+    API and sqladmin) or by `stage` for bulk statements, and are only moved
+    into the buffer once that session commits. `run` flushes it in the
+    background; when the buffer is full, `overflow` decides between waking
+    `run` early and dropping events. Commits happen on the event loop, so
+    "flush" never writes inline while `run` is active: the buffer may grow to
+    twice `size` before the oldest events are dropped. A batch that fails
+    `max_attempts` flushes in a row goes to `dead_letter_dir`.
+    """
+
+    def __init__(self, size: int = AUDIT_BUFFER_SIZE, overflow: str = AUDIT_OVERFLOW,
+                 batch_size: int = AUDIT_BATCH_SIZE, max_attempts: int = AUDIT_MAX_ATTEMPTS,
+                 dead_letter_dir: str = AUDIT_DEAD_LETTER_DIR):
+        self.size = size
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.dead_letter_dir = Path(dead_letter_dir)
+        self.buffer: deque[dict] = deque()
+        # The batch the last flush could not write, retried before the buffer.
+        self.failed: Optional[list[dict]] = None
+        self.attempts = 0
+        self.flush_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wake: Optional[asyncio.Event] = None
+
+    def install(self):
+        event.listen(Session, "after_flush", stage_flushed)
+        event.listen(Session, "after_commit", self.after_commit)
+        event.listen(Session, "after_rollback", lambda db: db.info.pop("audit", None))
+
+    def after_commit(self, db: Session):
+        staged = db.info.pop("audit", None)
+        if staged:
+            self.push(staged)
+
+    def push(self, events: list[dict]):
+        for item in events:
+            if len(self.buffer) >= self.size:
+                if self.overflow == "drop_newest":
+                    self.dropped += 1
+                    continue
+                if self.overflow == "drop_oldest":
+                    self.buffer.popleft()
+                    self.dropped += 1
+                else:
+                    try:
+                        self.request_flush()
+                    except Exception:
+                        logger.exception("Audit flush on overflow failed")
+                    if len(self.buffer) >= 2 * self.size:
+                        self.buffer.popleft()
+                        self.dropped += 1
+            self.buffer.append(item)
+
+    def request_flush(self):
+        if self.loop is None:
+            # Nothing flushes in the background (scripts, tests), so write here.
+            self.flush()
+        elif not self.wake.is_set():
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    async def run(self, interval: float):
+        """Flush every `interval` seconds, or as soon as `push` finds the buffer full."""
+        self.loop, self.wake = asyncio.get_running_loop(), asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+                try:
+                    await run_in_threadpool(self.flush)
+                except Exception:
+                    logger.exception("Audit flush failed")
+        finally:
+            self.loop = self.wake = None
+
+    def flush(self) -> int:
+        written = 0
+        with self.flush_lock:
+            while self.failed or self.buffer:
+                batch = self.failed or [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                self.failed = None
+                try:
+                    with SessionLocal() as db:
+                        db.execute(insert(AuditEvent), batch)
+                        db.commit()
+                except Exception:
+                    self.attempts += 1
+                    if self.attempts < self.max_attempts:
+                        self.failed = batch
+                        raise
+                    logger.exception("Audit batch failed %d times, moving it to the dead-letter directory",
+                                     self.attempts)
+                    self.attempts = 0
+                    self.dead_letter(batch)
+                    continue
+                self.attempts = 0
+                written += len(batch)
+        self.written += written
+        return written
+
+    def dead_letter(self, batch: list[dict]):
+        path = self.dead_letter_dir / f"audit-{datetime.utcnow():%Y%m%d}.ndjson"
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as file:
+                for item in batch:
+                    file.write(json.dumps(item, default=str, ensure_ascii=False) + "\n")
+        except Exception:
+            logger.exception("Could not write %d audit events to %s", len(batch), path)
+            self.dropped += len(batch)
+            return
+        self.dead_lettered += len(batch)
+
+    @property
+    def stats(self):
+        return {"buffered": len(self.buffer) + len(self.failed or ()), "written": self.written,
+                "dropped": self.dropped, "dead_lettered": self.dead_lettered}
+
+
+def month_start(day: date, months: int = 0) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_partitions(months_ahead: int = 2):
+    """Create this month's partition and the next ones before rows arrive for them;
+    anything that still misses lands in audit_events_default."""
+    today = date.today()
+    with SessionLocal() as db:
+        for offset in range(months_ahead + 1):
+            start, end = month_start(today, offset), month_start(today, offset + 1)
+            db.execute(text(f"CREATE TABLE IF NOT EXISTS audit_events_{start:%Y_%m} PARTITION OF audit_events "
+                            f"FOR VALUES FROM ('{start}') TO ('{end}')"))
+        db.commit()
+
+
+def request_actor(request) -> tuple[Optional[str], str]:
+    source = "admin" if request.url.path.startswith("/admin") else "api"
+    return token_claims(request).get("sub"), source
+
+
+class AuditActorMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        token = audit_actor.set(request_actor(request))
+        try:
+            return await call_next(request)
+        finally:
+            audit_actor.reset(token)
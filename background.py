@@ -0,0 +1,15 @@
+import asyncio
+import logging
+from starlette.concurrency import run_in_threadpool
+
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(interval: float, func, *args):
+    while True:
+        try:
+            await run_in_threadpool(func, *args)
+        except Exception:
+            logger.exception("Background task %s failed", func.__name__)
+        await asyncio.sleep(interval)
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from singleflight import SingleFlight
+
+
+QUERY_LATENCY = 0.005
+
+
+def bench_singleflight(requests: int = 5000, concurrency: int = 500):
+    import os
+    import tempfile
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from starlette.concurrency import run_in_threadpool
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    import main
+    from database import Base
+    from models import Tenant, UserProfile, Course, UserRole, StatusCourse, TypeCourse
+
+    directory = tempfile.TemporaryDirectory()
+    engine = create_engine(f'sqlite:///{directory.name}/bench.sqlite', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    main.SessionLocal = sessionmaker(bind=engine)
+    queries = 0
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(*args):
+        # Stands in for the round trip to Postgres.
+        nonlocal queries
+        queries += 1
+        time.sleep(QUERY_LATENCY)
+
+    with main.SessionLocal() as db:
+        db.add(Tenant(id=1, name='bench'))
+        db.add(UserProfile(first_name='a', last_name='b', username='bench', password='x', role=UserRole.teacher,
+                           tenant_id=1))
+        db.flush()
+        db.add(Course(course_name='bench', description='', level=StatusCourse.level1, price=0,
+                      type_course=TypeCourse.type1, author_id=1, tenant_id=1))
+        db.commit()
+
+    async def run(load):
+        started = time.perf_counter()
+        for start in range(0, requests, concurrency):
+            batch = min(concurrency, requests - start)
+            await asyncio.gather(*(load() for _ in range(batch)))
+        return time.perf_counter() - started
+
+    flights = {'without coalescing': None, 'singleflight ttl=0.0': SingleFlight(),
+               'singleflight ttl=1.0': SingleFlight(cache_ttl=1.0)}
+    for name, flight in flights.items():
+        queries = 0
+        if flight is None:
+            elapsed = asyncio.run(run(lambda: run_in_threadpool(main.load_course, 1)))
+            detail = ''
+        else:
+            elapsed = asyncio.run(run(lambda: flight.do(1, main.load_course, 1)))
+            detail = f' (coalesced={flight.stats["coalesced"]}, cache_hits={flight.stats["cache_hits"]})'
+        print(f'{name}: {requests} requests -> {queries} queries{detail} in {elapsed:.3f}s')
+    engine.dispose()
+    directory.cleanup()
+
+
+def bench_patch_round_trips(updates: int = 200):
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import Tenant, UserProfile, Course, UserRole, StatusCourse, TypeCourse
+    from schema import CourseSchema, CoursePatchSchema
+    from patch import patch_row
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    statements = 0
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    with Session() as db:
+        db.add(Tenant(id=1, name='bench'))
+        db.add(UserProfile(first_name='a', last_name='b', username='bench', password='x', role=UserRole.teacher,
+                           tenant_id=1))
+        db.flush()
+        db.add(Course(course_name='bench', description='', level=StatusCourse.level1, price=0,
+                      type_course=TypeCourse.type1, author_id=1, tenant_id=1))
+        db.commit()
+
+    def put(db, n):
+        course = db.query(Course).filter(Course.id == 1).first()
+        data = CourseSchema.model_validate(course).model_copy(update={'course_name': f'put {n}'})
+        for key, value in data.dict(exclude={'version'}).items():
+            setattr(course, key, value)
+        db.commit()
+        db.refresh(course)
+
+    def patch(db, n):
+        version = 1 + updates + n
+        patch_row(db, Course, 1, CoursePatchSchema(version=version, course_name=f'patch {n}'),
+                  db.query(Course))
+
+    for name, flow in (('PUT  ', put), ('PATCH', patch)):
+        statements = 0
+        started = time.perf_counter()
+        with Session() as db:
+            for n in range(updates):
+                flow(db, n)
+        elapsed = time.perf_counter() - started
+        print(f'{name} {updates} updates: {statements / updates:.1f} statements per update, {elapsed:.3f}s')
+
+
+def bench_certificate_verify(certificates: int = 1_000_000, lookups: int = 200_000):
+    import secrets
+    from array import array
+    from certificates import CertificateIndex, code_hash
+
+    codes = [secrets.token_urlsafe(12) for _ in range(certificates)]
+    pairs = sorted((code_hash(code), certificate_id) for certificate_id, code in enumerate(codes, 1))
+    index = CertificateIndex()
+    index.hashes = array('Q', [digest for digest, _ in pairs])
+    index.ids = array('I', [certificate_id for _, certificate_id in pairs])
+    size = index.hashes.itemsize * len(index.hashes) + index.ids.itemsize * len(index.ids)
+
+    for name, sample in (('hit ', codes), ('miss', [secrets.token_urlsafe(12) for _ in range(1000)])):
+        queries = [sample[n % len(sample)] for n in range(lookups)]
+        started = time.perf_counter()
+        for code in queries:
+            index.lookup(code)
+        elapsed = time.perf_counter() - started
+        print(f'certificate verify {name}: {lookups / elapsed:,.0f} lookups/s over {certificates:,} certificates '
+              f'({size / 2 ** 20:.1f} MiB index)')
+
+
+if __name__ == '__main__':
+    bench_singleflight()
+    bench_patch_round_trips()
+    bench_certificate_verify()
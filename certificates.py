@@ -0,0 +1,131 @@
+import threading
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from typing import Callable, Optional
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Certificate
+
+
+def code_hash(code: str) -> int:
+    return int.from_bytes(blake2b(code.encode(), digest_size=8).digest(), "little")
+
+
+class CertificateIndex:
+    """Verification codes as a sorted array of 64-bit hashes with the matching
+    certificate ids alongside: 12 bytes per certificate.
+
+    Unknown codes are answered from memory. A hit only names candidate ids;
+    the caller confirms the code against the row, so a hash collision cannot
+    verify the wrong certificate. `install` keeps the index in step with every
+    committed ORM insert and delete, from the API and sqladmin alike.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hashes = array("Q")
+        self.ids = array("I")
+        # Changes that arrive while load() reads the table, replayed on top of it.
+        self.pending: Optional[list[tuple[bool, int, int]]] = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def load(self):
+        with self.lock:
+            self.pending = []
+        try:
+            with SessionLocal() as db:
+                rows = db.execute(select(Certificate.id, Certificate.verification_code)).all()
+            pairs = sorted((code_hash(code), certificate_id) for certificate_id, code in rows)
+            hashes = array("Q", [digest for digest, _ in pairs])
+            ids = array("I", [certificate_id for _, certificate_id in pairs])
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            self.hashes, self.ids = hashes, ids
+            pending, self.pending = self.pending, None
+            for added, certificate_id, digest in pending:
+                (self._add if added else self._remove)(certificate_id, digest)
+
+    def _position(self, certificate_id: int, digest: int) -> tuple[int, bool]:
+        position = bisect_left(self.hashes, digest)
+        while position < len(self.hashes) and self.hashes[position] == digest:
+            if self.ids[position] == certificate_id:
+                return position, True
+            position += 1
+        return position, False
+
+    def _add(self, certificate_id: int, digest: int):
+        position, found = self._position(certificate_id, digest)
+        if not found:
+            self.hashes.insert(position, digest)
+            self.ids.insert(position, certificate_id)
+
+    def _remove(self, certificate_id: int, digest: int):
+        position, found = self._position(certificate_id, digest)
+        if found:
+            del self.hashes[position]
+            del self.ids[position]
+
+    def add(self, certificate_id: int, digest: int):
+        with self.lock:
+            self._add(certificate_id, digest)
+            if self.pending is not None:
+                self.pending.append((True, certificate_id, digest))
+
+    def remove(self, certificate_id: int, digest: int):
+        with self.lock:
+            self._remove(certificate_id, digest)
+            if self.pending is not None:
+                self.pending.append((False, certificate_id, digest))
+
+    def lookup(self, code: str) -> list[int]:
+        digest = code_hash(code)
+        with self.lock:
+            position = bisect_left(self.hashes, digest)
+            found = []
+            while position < len(self.hashes) and self.hashes[position] == digest:
+                found.append(self.ids[position])
+                position += 1
+            return found
+
+    def install(self, notify: Callable[[str, dict], None]):
+        """Apply committed changes here and hand them to `notify` for the other workers."""
+        event.listen(Session, "before_flush", self.stage_deleted)
+        event.listen(Session, "after_flush", self.stage_created)
+        event.listen(Session, "after_commit", lambda db: self.after_commit(db, notify))
+        event.listen(Session, "after_rollback", lambda db: db.info.pop("certificate_index", None))
+
+    @staticmethod
+    def stage(db: Session, name: str, certificate: Certificate):
+        # Only the hash is shared: topics can be read by any /events/ client.
+        data = {"id": certificate.id, "hash": code_hash(certificate.verification_code)}
+        db.info.setdefault("certificate_index", []).append({"event": name, "data": data})
+
+    def stage_deleted(self, db: Session, flush_context, instances):
+        # Before the flush, while the row can still be read.
+        for obj in db.deleted:
+            if isinstance(obj, Certificate):
+                self.stage(db, "certificate.deleted", obj)
+
+    def stage_created(self, db: Session, flush_context):
+        for obj in db.new:
+            if isinstance(obj, Certificate):
+                self.stage(db, "certificate.created", obj)
+
+    def after_commit(self, db: Session, notify: Callable[[str, dict], None]):
+        for change in db.info.pop("certificate_index", None) or ():
+            self.apply(change)
+            notify(change["event"], change["data"])
+
+    def apply(self, event: dict):
+        data = event["data"]
+        if event["event"] == "certificate.created":
+            self.add(data["id"], data["hash"])
+        elif event["event"] == "certificate.deleted":
+            self.remove(data["id"], data["hash"])
@@ -0,0 +1 @@
+pytest_plugins = ['pytest_query_budget']
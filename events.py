@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Callable, Optional
+from config import EVENT_BROKER_URL, EVENT_QUEUE_SIZE, EVENT_MAX_DROPPED
+
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[str, str], None]
+
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+
+class Hub:
+    """In-process fan-out of topic messages to connected clients.
+
+    Each subscriber has a bounded queue. When a slow client's queue is full the
+    oldest message is dropped; after `max_dropped` drops the subscriber gets a
+    None sentinel and is removed, so the client reconnects and reloads state
+    instead of holding memory for a backlog it cannot drain.
+    """
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, max_dropped: int = EVENT_MAX_DROPPED):
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.topics: dict[str, set[Subscriber]] = defaultdict(set)
+
+    def subscribe(self, topic: str) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self.topics[topic].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, topic: str, subscriber: Subscriber):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.topics[topic]
+
+    def deliver(self, topic: str, message: str):
+        for subscriber in list(self.topics.get(topic, ())):
+            if subscriber.queue.full():
+                subscriber.queue.get_nowait()
+                subscriber.dropped += 1
+                if subscriber.dropped > self.max_dropped:
+                    self.unsubscribe(topic, subscriber)
+                    subscriber.queue.put_nowait(None)
+                    continue
+            subscriber.queue.put_nowait(message)
+
+
+class LocalBroker:
+    """Single-process broker; also the stand-in for RedisBroker in tests."""
+
+    def __init__(self):
+        self.listeners: list[Listener] = []
+
+    async def start(self, listener: Listener):
+        self.listeners.append(listener)
+
+    async def stop(self):
+        self.listeners.clear()
+
+    async def publish(self, topic: str, message: str):
+        for listener in self.listeners:
+            listener(topic, message)
+
+
+class RedisBroker:
+    """Fans messages out to every worker through one Redis pub/sub channel."""
+
+    def __init__(self, url: str, channel: str = "course-events"):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+        self.channel = channel
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self, listener: Listener):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        self.task = asyncio.create_task(self._listen(pubsub, listener))
+
+    async def _listen(self, pubsub, listener: Listener):
+        async for item in pubsub.listen():
+            if item["type"] != "message":
+                continue
+            try:
+                topic, message = json.loads(item["data"])
+                listener(topic, message)
+            except Exception:
+                logger.exception("Bad event from broker")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        await self.redis.aclose()
+
+    async def publish(self, topic: str, message: str):
+        await self.redis.publish(self.channel, json.dumps([topic, message]))
+
+
+class EventBus:
+    def __init__(self, broker=None):
+        self.hub = Hub()
+        self.broker = broker or LocalBroker()
+        self.handlers: dict[str, list[Callable[[dict], None]]] = defaultdict(list)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def on(self, topic: str, handler: Callable[[dict], None]):
+        """Run `handler` in every worker for each event published to `topic`.
+
+        Topics with handlers are internal and never reach subscribers."""
+        self.handlers[topic].append(handler)
+
+    def dispatch(self, topic: str, message: str):
+        for handler in self.handlers.get(topic, ()):
+            try:
+                handler(json.loads(message))
+            except Exception:
+                logger.exception("Event handler for %s failed", topic)
+        if topic not in self.handlers:
+            self.hub.deliver(topic, message)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self.broker.start(self.dispatch)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    async def publish(self, topic: str, event: str, data: dict):
+        try:
+            await self.broker.publish(topic, json.dumps({"event": event, "data": data}, default=str))
+        except Exception:
+            logger.exception("Failed to publish %s to %s", event, topic)
+
+    def publish_threadsafe(self, topic: str, event: str, data: dict):
+        """Schedule `publish` from synchronous code, on the loop or in a worker thread."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.publish(topic, event, data), self.loop)
+
+
+def get_event_bus() -> EventBus:
+    if EVENT_BROKER_URL:
+        return EventBus(RedisBroker(EVENT_BROKER_URL))
+    return EventBus()
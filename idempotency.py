@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response
+from database import SessionLocal
+from models import IdempotencyKey
+from tenancy import current_tenant, token_claims
+from config import IDEMPOTENCY_TTL_HOURS, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_LEASE_SECONDS, \
+    IDEMPOTENCY_WAIT_SECONDS, IDEMPOTENCY_POLL_SECONDS
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    media_type: Optional[str]
+    body: bytes
+    expires_at: datetime
+
+    def to_response(self):
+        return Response(content=self.body, status_code=self.status_code, media_type=self.media_type,
+                        headers={"Idempotent-Replayed": "true"})
+
+
+class IdempotencyStore:
+    """Stored POST responses: Postgres table with an in-process LRU in front.
+
+    A request claims its key with a pending row before running the handler,
+    so a retry that lands on another worker polls that row instead of running
+    the handler again. `in_flight` holds one future per key so retries in the
+    same process wait without polling.
+    """
+
+    def __init__(self, cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+                 ttl: timedelta = timedelta(hours=IDEMPOTENCY_TTL_HOURS)):
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.cache: OrderedDict[str, StoredResponse] = OrderedDict()
+        self.in_flight: dict[str, asyncio.Future] = {}
+
+    def remember(self, key: str, stored: StoredResponse):
+        self.cache[key] = stored
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        stored = self.cache.get(key)
+        if stored is not None:
+            if stored.expires_at > datetime.utcnow():
+                self.cache.move_to_end(key)
+                return stored
+            del self.cache[key]
+        stored = await run_in_threadpool(self._load, key)
+        if stored is not None:
+            self.remember(key, stored)
+        return stored
+
+    async def put(self, key: str, stored: StoredResponse):
+        await run_in_threadpool(self._save, key, stored)
+        self.remember(key, stored)
+
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        return await run_in_threadpool(self._claim, key, fingerprint)
+
+    async def release(self, key: str):
+        await run_in_threadpool(self._release, key)
+
+    async def wait(self, key: str) -> Optional[StoredResponse]:
+        """Poll a key claimed by another worker until its response is stored."""
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+            stored = await self.get(key)
+            if stored is not None:
+                return stored
+        return None
+
+    def _load(self, key: str) -> Optional[StoredResponse]:
+        with SessionLocal() as db:
+            row = db.get(IdempotencyKey, key)
+            if row is None or row.status_code is None or row.expires_at <= datetime.utcnow():
+                return None
+            return StoredResponse(row.fingerprint, row.status_code, row.media_type, row.body, row.expires_at)
+
+    def _claim(self, key: str, fingerprint: str) -> bool:
+        # A pending row expires after the lease, so a worker that died mid-request
+        # does not block the key until the TTL runs out.
+        now = datetime.utcnow()
+        statement = insert(IdempotencyKey).values(key=key, fingerprint=fingerprint, created_at=now,
+                                                  expires_at=now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS))
+        statement = statement.on_conflict_do_update(
+            index_elements=[IdempotencyKey.key],
+            set_={"fingerprint": statement.excluded.fingerprint, "status_code": None, "media_type": None,
+                  "body": None, "created_at": now, "expires_at": statement.excluded.expires_at},
+            where=IdempotencyKey.expires_at <= now,
+        ).returning(IdempotencyKey.key)
+        with SessionLocal() as db:
+            claimed = db.execute(statement).first() is not None
+            db.commit()
+            return claimed
+
+    def _save(self, key: str, stored: StoredResponse):
+        with SessionLocal() as db:
+            db.execute(
+                update(IdempotencyKey).where(IdempotencyKey.key == key)
+                .values(fingerprint=stored.fingerprint, status_code=stored.status_code,
+                        media_type=stored.media_type, body=stored.body, expires_at=stored.expires_at)
+            )
+            db.commit()
+
+    def _release(self, key: str):
+        with SessionLocal() as db:
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)))
+            db.commit()
+
+    def purge_expired(self) -> int:
+        with SessionLocal() as db:
+            result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+            db.commit()
+            return result.rowcount
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, store: IdempotencyStore):
+        super().__init__(app)
+        self.store = store
+
+    async def dispatch(self, request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != "POST" or not key:
+            return await call_next(request)
+
+        # Keys are per caller; the query string is part of the request being repeated.
+        scoped_key = f"{current_tenant.get()}:{token_claims(request).get('sub')}:{request.url.path}:{key}"
+        fingerprint = hashlib.sha256(request.url.query.encode() + b"\n" + await request.body()).hexdigest()
+
+        while (pending := self.store.in_flight.get(scoped_key)) is not None:
+            stored = await asyncio.shield(pending)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+
+        future = asyncio.get_running_loop().create_future()
+        self.store.in_flight[scoped_key] = future
+        stored = None
+        try:
+            stored = await self.store.get(scoped_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+            if not await self.store.claim(scoped_key, fingerprint):
+                stored = await self.store.wait(scoped_key)
+                if stored is None:
+                    return JSONResponse(status_code=409,
+                                        content={"detail": "A request with this Idempotency-Key is in progress"})
+                return self.replay(stored, fingerprint)
+
+            try:
+                response = await call_next(request)
+                body = b"".join([chunk async for chunk in response.body_iterator])
+            except BaseException:
+                await self.store.release(scoped_key)
+                raise
+            stored = StoredResponse(fingerprint, response.status_code, response.headers.get("content-type"),
+                                    body, datetime.utcnow() + self.store.ttl)
+            if response.status_code < 500:
+                await self.store.put(scoped_key, stored)
+            else:
+                await self.store.release(scoped_key)
+            return Response(content=body, status_code=response.status_code, headers=dict(response.headers))
+        finally:
+            del self.store.in_flight[scoped_key]
+            future.set_result(stored)
+
+    @staticmethod
+    def replay(stored: StoredResponse, fingerprint: str):
+        if stored.fingerprint != fingerprint:
+            return JSONResponse(status_code=422,
+                                content={"detail": "Idempotency-Key was already used with a different request"})
+        return stored.to_response()
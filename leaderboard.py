@@ -0,0 +1,137 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from database import SessionLocal
+from models import Exam, ExamAttempt, LeaderboardSnapshot
+from config import LEADERBOARD_REPLAY_MARGIN_SECONDS
+
+
+class Leaderboard:
+    """Scores kept as a sorted array of (-score, student_id) for rank lookups."""
+
+    def __init__(self, scores: Optional[dict[int, int]] = None):
+        self.scores: dict[int, int] = scores or {}
+        self.entries: list[tuple[int, int]] = sorted((-score, student_id)
+                                                     for student_id, score in self.scores.items())
+
+    def set(self, student_id: int, score: int):
+        old = self.scores.get(student_id)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, (-old, student_id))]
+        insort(self.entries, (-score, student_id))
+        self.scores[student_id] = score
+
+    def rank(self, student_id: int) -> Optional[int]:
+        score = self.scores.get(student_id)
+        if score is None:
+            return None
+        # Equal scores share a rank: count everyone strictly ahead.
+        return bisect_left(self.entries, (-score,)) + 1
+
+    def window(self, start: int, stop: int) -> list[dict]:
+        start = max(start, 0)
+        result = []
+        for neg_score, student_id in self.entries[start:stop]:
+            result.append({"rank": bisect_left(self.entries, (neg_score,)) + 1,
+                           "student_id": student_id, "score": -neg_score})
+        return result
+
+    def top(self, limit: int) -> list[dict]:
+        return self.window(0, limit)
+
+    def around(self, student_id: int, size: int) -> list[dict]:
+        score = self.scores.get(student_id)
+        if score is None:
+            return []
+        position = bisect_left(self.entries, (-score, student_id))
+        return self.window(position - size, position + size + 1)
+
+
+class Leaderboards:
+    """Per-exam boards of each student's best attempt, and per-course boards
+    of the sum of those bests.
+
+    Only exam boards are snapshotted; course boards are rebuilt from them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.exams: dict[int, Leaderboard] = {}
+        self.courses: dict[int, Leaderboard] = {}
+        self.exam_courses: dict[int, int] = {}
+        self.dirty: set[tuple[int, int]] = set()
+
+    def board(self, kind: str, board_id: int) -> Optional[Leaderboard]:
+        return (self.exams if kind == "exam" else self.courses).get(board_id)
+
+    def apply(self, exam_id: int, course_id: int, student_id: int, score: int):
+        with self.lock:
+            self.exam_courses[exam_id] = course_id
+            exam_board = self.exams.setdefault(exam_id, Leaderboard())
+            best = exam_board.scores.get(student_id)
+            if best is not None and best >= score:
+                return
+            exam_board.set(student_id, score)
+            self.dirty.add((exam_id, student_id))
+            course_board = self.courses.setdefault(course_id, Leaderboard())
+            course_board.set(student_id, course_board.scores.get(student_id, 0) + score - (best or 0))
+
+    def snapshot(self) -> int:
+        taken_at = datetime.utcnow()
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            rows = [{"exam_id": exam_id, "student_id": student_id, "taken_at": taken_at,
+                     "score": self.exams[exam_id].scores[student_id]} for exam_id, student_id in dirty]
+        if not rows:
+            return 0
+        statement = insert(LeaderboardSnapshot)
+        statement = statement.on_conflict_do_update(
+            index_elements=[LeaderboardSnapshot.exam_id, LeaderboardSnapshot.student_id],
+            set_={"score": func.greatest(LeaderboardSnapshot.score, statement.excluded.score),
+                  "taken_at": statement.excluded.taken_at},
+        )
+        try:
+            with SessionLocal() as db:
+                db.execute(statement, rows)
+                db.commit()
+        except Exception:
+            with self.lock:
+                self.dirty |= dirty
+            raise
+        return len(rows)
+
+    def restore(self):
+        with SessionLocal() as db:
+            exam_courses = dict(db.execute(select(Exam.id, Exam.course_id)).all())
+            snapshot = db.execute(select(LeaderboardSnapshot.exam_id, LeaderboardSnapshot.student_id,
+                                         LeaderboardSnapshot.score)).all()
+            last_taken = db.scalar(select(func.max(LeaderboardSnapshot.taken_at)))
+            replay = select(ExamAttempt.exam_id, ExamAttempt.student_id, func.max(ExamAttempt.score)) \
+                .group_by(ExamAttempt.exam_id, ExamAttempt.student_id)
+            if last_taken is not None:
+                since = last_taken - timedelta(seconds=LEADERBOARD_REPLAY_MARGIN_SECONDS)
+                replay = replay.where(ExamAttempt.submitted_at >= since)
+            attempts = db.execute(replay).all()
+
+        best: dict[tuple[int, int], int] = {}
+        for exam_id, student_id, score in [*snapshot, *attempts]:
+            if exam_id in exam_courses:
+                best[exam_id, student_id] = max(score, best.get((exam_id, student_id), score))
+
+        exam_scores: dict[int, dict[int, int]] = {}
+        course_scores: dict[int, dict[int, int]] = {}
+        for (exam_id, student_id), score in best.items():
+            exam_scores.setdefault(exam_id, {})[student_id] = score
+            totals = course_scores.setdefault(exam_courses[exam_id], {})
+            totals[student_id] = totals.get(student_id, 0) + score
+        exams = {exam_id: Leaderboard(scores) for exam_id, scores in exam_scores.items()}
+        courses = {course_id: Leaderboard(scores) for course_id, scores in course_scores.items()}
+
+        with self.lock:
+            self.exams, self.courses, self.exam_courses = exams, courses, exam_courses
+            # Bests that only came from replaying attempts are not in the table yet.
+            saved = {(exam_id, student_id): score for exam_id, student_id, score in snapshot}
+            self.dirty = {key for key, score in best.items() if saved.get(key) != score}
@@ -1,21 +1,175 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import mimetypes
+import signal
+import threading
 import jwt.api_jwt
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.openapi.models import Response
+from fastapi import FastAPI, Depends, HTTPException, status, Request, BackgroundTasks, WebSocket, \
+WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import Response
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
-from database import SessionLocal
-from models import Category, UserProfile, Course, Lesson, Exam, Question, Certificate, RefreshToken
+from pydantic import ValidationError
+from typing import List, Literal
+from contextlib import asynccontextmanager
+from database import SessionLocal, engine, ping_database, pool_status
+from models import Category, UserProfile, Course, Lesson, Exam, Question, Certificate, RefreshToken, ExamAttempt, \
+Order, Payment, Enrollment, TypeCourse, AuditEvent, UserRole, OrderStatus
 from schema import CategorySchema, UserProfileSchema, CourseSchema, LessonSchema, ExamSchema, QuestionSchema, \
-CertificateSchema, UserLogin
+CertificateSchema, IssuedCertificateSchema, UserLogin, CoursePatchSchema, LessonPatchSchema, QuestionPatchSchema, \
+CertificatePatchSchema, SimilarCourseSchema, ExamSubmissionSchema, ExamAttemptSchema, LeaderboardEntrySchema, \
+CheckoutSchema, OrderSchema, PaymentWebhookSchema, AuditPageSchema
 from admin import setup_admin
-from config import SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM
+from config import SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM, \
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS, DETAIL_CACHE_TTL_SECONDS, PURGE_INTERVAL_SECONDS, EVENT_HEARTBEAT_SECONDS, \
+RECOMMEND_RELOAD_SECONDS, LEADERBOARD_SNAPSHOT_SECONDS, HEALTH_CHECK_TIMEOUT_SECONDS, \
+OUTBOX_POLL_SECONDS, PAYMENT_WEBHOOK_SECRET, CERTIFICATE_INDEX_RELOAD_SECONDS, AUDIT_FLUSH_SECONDS, \
+AUDIT_PARTITION_CHECK_SECONDS, AUDIT_PAGE_SIZE, TENANT_RELOAD_SECONDS, RETENTION_INTERVAL_SECONDS, \
+MEDIA_VIDEO_TYPES, MEDIA_CONTENT_TYPES, MEDIA_IMAGE_TYPES
+from idempotency import IdempotencyStore, IdempotencyMiddleware
+from query_budget import QueryBudgetMiddleware, query_budget
+from background import run_periodically
+from singleflight import SingleFlight
+from purger import purge_deleted
+from storage import get_storage, limited, UploadTooLarge
+from media import make_image_thumbnail, make_video_poster
+from events import get_event_bus
+from patch import patch_row
+from recommend import Recommender
+from leaderboard import Leaderboards
+from certificates import CertificateIndex
+from audit import AuditLog, AuditActorMiddleware, ensure_partitions
+from tenancy import TenantResolver, TenantMiddleware, tenant_key, tenant_topic, token_claims, current_tenant
+from retention import RetentionScheduler
+from payments import get_payment_gateway
+from outbox import enqueue, drain_outbox, settle_payment, CHARGE_PAYMENT
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import timedelta, datetime, timezone
 
-course_app = FastAPI(title='Course site')
+logger = logging.getLogger(__name__)
+
+tenant_resolver = TenantResolver()
+
+idempotency_store = IdempotencyStore()
+
+course_flight = SingleFlight(cache_ttl=DETAIL_CACHE_TTL_SECONDS)
+lesson_flight = SingleFlight(cache_ttl=DETAIL_CACHE_TTL_SECONDS)
+
+media_storage = get_storage()
+MEDIA_URL_PREFIX = '/media/'
+
+event_bus = get_event_bus()
+
+recommender = Recommender(notify=lambda event, data: event_bus.publish_threadsafe('recommend', event, data))
+event_bus.on('recommend', recommender.apply)
+
+leaderboards = Leaderboards()
+event_bus.on('leaderboard', lambda event: leaderboards.apply(**event['data']))
+
+payment_gateway = get_payment_gateway()
+
+certificate_index = CertificateIndex()
+event_bus.on('certificate-index', certificate_index.apply)
+certificate_index.install(lambda event, data: event_bus.publish_threadsafe('certificate-index', event, data))
+
+audit_log = AuditLog()
+audit_log.install()
+
+retention = RetentionScheduler()
+
+
+def mark_draining(app: FastAPI, previous):
+    # uvicorn stops accepting connections on SIGTERM but keeps serving open ones
+    # while it drains; readiness has to fail from that moment, not after.
+    def handler(sig, frame):
+        app.state.ready = False
+        if callable(previous):
+            previous(sig, frame)
+    return handler
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process: the engine and its pool belong to the worker.
+    await run_in_threadpool(ping_database)
+    await run_in_threadpool(tenant_resolver.load)
+    await run_in_threadpool(leaderboards.restore)
+    await run_in_threadpool(certificate_index.load)
+    await event_bus.start()
+    periodic = [
+        (TENANT_RELOAD_SECONDS, tenant_resolver.load),
+        (IDEMPOTENCY_PURGE_INTERVAL_SECONDS, idempotency_store.purge_expired),
+        (PURGE_INTERVAL_SECONDS, purge_deleted),
+        (RECOMMEND_RELOAD_SECONDS, recommender.load_neighbors),
+        (LEADERBOARD_SNAPSHOT_SECONDS, leaderboards.snapshot),
+        (CERTIFICATE_INDEX_RELOAD_SECONDS, certificate_index.load),
+        (AUDIT_PARTITION_CHECK_SECONDS, ensure_partitions),
+        (RETENTION_INTERVAL_SECONDS, retention.enforce),
+    ]
+    tasks = [asyncio.create_task(run_periodically(interval, func)) for interval, func in periodic]
+    tasks.append(asyncio.create_task(run_periodically(OUTBOX_POLL_SECONDS, drain_outbox, payment_gateway)))
+    tasks.append(asyncio.create_task(audit_log.run(AUDIT_FLUSH_SECONDS)))
+    # Signal handlers can only be set from the main thread, which is where uvicorn runs us.
+    handled = (signal.SIGTERM, signal.SIGINT) if threading.current_thread() is threading.main_thread() else ()
+    previous = {sig: signal.signal(sig, mark_draining(app, signal.getsignal(sig))) for sig in handled}
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await event_bus.stop()
+        try:
+            await run_in_threadpool(leaderboards.snapshot)
+        except Exception:
+            logger.exception("Final leaderboard snapshot failed")
+        try:
+            await run_in_threadpool(audit_log.flush)
+        except Exception:
+            logger.exception("Final audit flush failed, %d events lost", len(audit_log.buffer))
+        await run_in_threadpool(engine.dispose)
+
+
+course_app = FastAPI(title='Course site', lifespan=lifespan)
+course_app.state.ready = False
 setup_admin(course_app)
+course_app.add_middleware(QueryBudgetMiddleware)
+course_app.add_middleware(AuditActorMiddleware)
+course_app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+course_app.add_middleware(TenantMiddleware, resolver=tenant_resolver)
+
+
+@course_app.get('/health/live')
+@query_budget(0)
+async def health_live():
+    return {'status': 'ok'}
+
+
+@course_app.get('/health/ready')
+@query_budget(1)
+async def health_ready():
+    pool = pool_status()
+    if not course_app.state.ready:
+        return JSONResponse(status_code=503, content={'status': 'starting or draining', 'pool': pool})
+    if pool['checked_out'] >= pool['capacity']:
+        return JSONResponse(status_code=503, content={'status': 'database pool exhausted', 'pool': pool})
+    try:
+        await asyncio.wait_for(run_in_threadpool(ping_database), HEALTH_CHECK_TIMEOUT_SECONDS)
+    except Exception:
+        return JSONResponse(status_code=503, content={'status': 'database unavailable', 'pool': pool})
+    return {'status': 'ok', 'pool': pool}
+
 
 password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -49,7 +203,85 @@ async def get_db():
         db.close()
 
 
+def get_teacher(request: Request, db: Session = Depends(get_db)) -> UserProfile:
+    username = token_claims(request).get('sub')
+    user = db.query(UserProfile).filter(UserProfile.username==username).first() if username else None
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not authenticated')
+    if user.role != UserRole.teacher:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Only teachers can do this')
+    return user
+
+
+def live_query(db: Session, model):
+    query = db.query(model)
+    if model is Category:
+        return query.filter(Category.deleted_at.is_(None))
+    if model is Question:
+        query = query.join(Exam)
+    if model is not Course:
+        query = query.join(Course)
+    return query.filter(Course.deleted_at.is_(None))
+
+
+# Only TenantScoped rows are filtered, so an id sent by the client for one of
+# these has to be looked up in the caller's school before it is written.
+REFERENCES = {'course_id': Course, 'exam_id': Exam, 'category_id': Category, 'author_id': UserProfile,
+              'student_id': UserProfile}
+
+
+def check_references(db: Session, values: dict, row=None):
+    """404 unless every referenced row is live and in the current school; ids
+    that `row` already holds are not looked up again."""
+    for key, model in REFERENCES.items():
+        row_id = values.get(key)
+        if row_id is None or (row is not None and getattr(row, key) == row_id):
+            continue
+        query = db.query(model.id) if model is UserProfile else live_query(db, model).with_entities(model.id)
+        if query.filter(model.id==row_id).first() is None:
+            raise HTTPException(status_code=404, detail=f'{model.__name__} not found')
+
+
+def load_course(course_id: int):
+    with SessionLocal() as db:
+        course = live_query(db, Course).filter(Course.id==course_id).first()
+        if course is None:
+            return None
+        return CourseSchema.model_validate(course).model_dump_json().encode()
+
+
+def load_lesson(lesson_id: int):
+    with SessionLocal() as db:
+        lesson = live_query(db, Lesson).filter(Lesson.id==lesson_id).first()
+        if lesson is None:
+            return None
+        return LessonSchema.model_validate(lesson).model_dump_json().encode()
+
+
+async def publish_change(topic: str, event: str, schema, obj):
+    await event_bus.publish(tenant_topic(topic), event, schema.model_validate(obj).model_dump(mode='json'))
+
+
+@course_app.get('/metrics/singleflight/')
+@query_budget(0)
+async def singleflight_metrics():
+    return {"course": course_flight.stats, "lesson": lesson_flight.stats}
+
+
+@course_app.get('/metrics/audit/')
+@query_budget(0)
+async def audit_metrics():
+    return audit_log.stats
+
+
+@course_app.get('/metrics/retention/')
+@query_budget(0)
+async def retention_metrics():
+    return retention.stats
+
+
 @course_app.post('/register/')
+@query_budget(3)
 async def register(user: UserProfileSchema, db: Session = Depends(get_db)):
     user_db = db.query(UserProfile).filter(UserProfile.username==user.username).first()
     if user_db:
@@ -72,12 +304,14 @@ async def register(user: UserProfileSchema, db: Session = Depends(get_db)):
 
 
 @course_app.post("/login")
+@query_budget(2)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(UserProfile).filter(UserProfile.username == form_data.username).first()
     if not user or not verify_password(form_data.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Маалымат туура эмес")
-    access_token = create_access_token({"sub": user.username})
-    refresh_token = create_refresh_token({"sub": user.username})
+    claims = {"sub": user.username, "tenant": user.tenant_id}
+    access_token = create_access_token(claims)
+    refresh_token = create_refresh_token(claims)
     user_db = RefreshToken(token=refresh_token, user_id=user.id)
     db.add(user_db)
     db.commit()
@@ -86,6 +320,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 
 
 @course_app.post("/logout")
+@query_budget(2)
 def logout(refresh_token: str, db: Session = Depends(get_db)):
     stored_token = db.query(RefreshToken).filter(RefreshToken.token == refresh_token).first()
     if not stored_token:
@@ -96,30 +331,35 @@ def logout(refresh_token: str, db: Session = Depends(get_db)):
 
 
 @course_app.post('/category/create/', response_model=CategorySchema)
+@query_budget(2)
 async def create_category(category: CategorySchema, db: Session = Depends(get_db)):
     db_category = Category(category_name=category.category_name)
     db.add(db_category)
+    db.commit()
     db.refresh(db_category)
     return db_category
 
 
 @course_app.get("/category/", response_model=List[CategorySchema])
+@query_budget(1)
 async def list_category(db: Session = Depends(get_db)):
-    return db.query(Category).all()
+    return live_query(db, Category).all()
 
 
 @course_app.get("/category/{category_id}/", response_model=CategorySchema)
+@query_budget(1)
 async def detail_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id==category_id).first()
+    category = live_query(db, Category).filter(Category.id==category_id).first()
     if category is None:
         raise HTTPException(status_code=404, detail='Category not found')
     return category
 
 
 @course_app.put("/category/{category_id}/", response_model=CategorySchema)
+@query_budget(3)
 async def update_category(category_id: int, category_data: CategorySchema,
                           db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id==category_id).first()
+    category = live_query(db, Category).filter(Category.id==category_id).first()
     if category is None:
         raise HTTPException(status_code=404, detail='Category not found')
     category.category_name=category_data.category_name
@@ -129,11 +369,12 @@ async def update_category(category_id: int, category_data: CategorySchema,
 
 
 @course_app.delete("/category/{category_id}/", response_model=CategorySchema)
+@query_budget(3)
 async def delete_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id==category_id).first()
+    category = live_query(db, Category).filter(Category.id==category_id).first()
     if category is None:
         raise HTTPException(status_code=404, detail='Category not found')
-    db.delete(category)
+    category.deleted_at = datetime.utcnow()
     db.commit()
     return category
 
@@ -142,46 +383,79 @@ async def delete_category(category_id: int, db: Session = Depends(get_db)):
 
 
 @course_app.post('/course/create/', response_model=CourseSchema)
-async def course_create(course: CourseSchema, db: Session = Depends(get_db)):
-    db_course = Course(**course.dict())
+@query_budget(4)
+async def course_create(course: CourseSchema, tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    check_references(db, course.dict())
+    db_course = Course(**course.dict(exclude={'version'}))
     db.add(db_course)
     db.commit()
     db.refresh(db_course)
+    tasks.add_task(recommender.refresh_course, db_course.id)
     return db_course
 
 
 @course_app.get('/course/', response_model=List[CourseSchema])
+@query_budget(1)
 async def course_get(db: Session = Depends(get_db)):
-    return db.query(Course).all()
+    return live_query(db, Course).all()
 
 
 @course_app.get('/course/{course_id}/', response_model=CourseSchema)
-async def course_get(course_id: int, db: Session = Depends(get_db)):
-    course = db.query(Course).filter(Course.id==course_id).first()
-    if course is None:
+@query_budget(1)
+async def course_get(course_id: int):
+    body = await course_flight.do(tenant_key(course_id), load_course, course_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Course not found")
-    return course
+    return Response(content=body, media_type="application/json")
+
+@course_app.get('/course/{course_id}/similar', response_model=List[SimilarCourseSchema])
+@query_budget(1)
+async def course_similar(course_id: int, db: Session = Depends(get_db)):
+    # Neighbours never cross schools, so checking the course itself is enough.
+    if live_query(db, Course).with_entities(Course.id).filter(Course.id==course_id).first() is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return [{'course_id': similar_id, 'score': score} for similar_id, score in recommender.similar(course_id)]
+
 
 @course_app.put("/course_update/{course_id}/", response_model=CourseSchema)
-async def course_update(course_id: int, course_data: CourseSchema, db: Session = Depends(get_db)):
-    course = db.query(Course).filter(Course.id==course_id).first()
+@query_budget(5)
+async def course_update(course_id: int, course_data: CourseSchema, tasks: BackgroundTasks,
+                        db: Session = Depends(get_db)):
+    course = live_query(db, Course).filter(Course.id==course_id).first()
     if course is None:
         raise HTTPException(status_code=404, detail="Course not found")
-    for key, value in course_data.dict().items():
+    check_references(db, course_data.dict(), course)
+    for key, value in course_data.dict(exclude={'version'}).items():
         setattr(course, key, value)
 
     db.commit()
     db.refresh(course)
+    course_flight.forget(tenant_key(course_id))
+    tasks.add_task(recommender.refresh_course, course_id)
     return course
 
 
-@course_app.delete("/course_delete/course_id}/", response_model=CourseSchema)
-async def course_delete(course_id: int, db: Session = Depends(get_db)):
-    course = db.query(Course).filter(Course.id==course_id).first()
+@course_app.patch('/course/{course_id}/', response_model=CourseSchema)
+@query_budget(3)
+async def course_patch(course_id: int, course_data: CoursePatchSchema, tasks: BackgroundTasks,
+                       db: Session = Depends(get_db)):
+    check_references(db, course_data.model_dump(exclude_unset=True))
+    course = patch_row(db, Course, course_id, course_data, live_query(db, Course))
+    course_flight.forget(tenant_key(course_id))
+    tasks.add_task(recommender.refresh_course, course_id)
+    return course
+
+
+@course_app.delete("/course_delete/{course_id}/", response_model=CourseSchema)
+@query_budget(3)
+async def course_delete(course_id: int, tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    course = live_query(db, Course).filter(Course.id==course_id).first()
     if course is None:
         raise HTTPException(status_code=404, detail="Course not found")
-    db.delete(course)
+    course.deleted_at = datetime.utcnow()
     db.commit()
+    course_flight.forget(tenant_key(course_id))
+    tasks.add_task(recommender.remove_course, course_id)
     return course
 
 
@@ -189,87 +463,118 @@ async def course_delete(course_id: int, db: Session = Depends(get_db)):
 
 
 @course_app.post('/lesson_post/', response_model=LessonSchema)
+@query_budget(3)
 async def lesson_create(lesson: LessonSchema, db: Session = Depends(get_db)):
-     db_lesson = Lesson(**lesson.dict())
+     check_references(db, lesson.dict())
+     db_lesson = Lesson(**lesson.dict(exclude={'version'}))
      db.add(db_lesson)
      db.commit()
      db.refresh(db_lesson)
+     await publish_change(f'course-{db_lesson.course_id}', 'lesson.created', LessonSchema, db_lesson)
      return db_lesson
 
 
 @course_app.get("/lesson/", response_model=List[LessonSchema])
+@query_budget(1)
 async def lesson_get(db: Session = Depends(get_db)):
-    return db.query(Lesson).all()
+    return live_query(db, Lesson).all()
 
 
 @course_app.get('/lesson/{lesson_id}/', response_model=LessonSchema)
-async def lesson_detail(lesson_id: int,  db: Session = Depends(get_db)):
-    lesson = db.query(Lesson).filter(Lesson.id==lesson_id).first()
-    if lesson is None:
+@query_budget(1)
+async def lesson_detail(lesson_id: int):
+    body = await lesson_flight.do(tenant_key(lesson_id), load_lesson, lesson_id)
+    if body is None:
         raise HTTPException(status_code=404, detail='Lesson is not faund')
-    return lesson
+    return Response(content=body, media_type="application/json")
 
 
 @course_app.put('/lesson/{lesson_id}/', response_model=LessonSchema)
+@query_budget(4)
 async def lesson_put(lesson_id: int, lessons_data: LessonSchema,  db: Session = Depends(get_db)):
-    lesson = db.query(Lesson).filter(Lesson.id==lesson_id).first()
+    lesson = live_query(db, Lesson).filter(Lesson.id==lesson_id).first()
     if lesson is None:
         raise HTTPException(status_code=404, detail='Lesson is not faund')
-    for key, value in lessons_data.dict().items():
+    check_references(db, lessons_data.dict(), lesson)
+    for key, value in lessons_data.dict(exclude={'version'}).items():
         setattr(lesson, key, value)
     db.commit()
     db.refresh(lesson)
+    lesson_flight.forget(tenant_key(lesson_id))
+    await publish_change(f'course-{lesson.course_id}', 'lesson.updated', LessonSchema, lesson)
+    return lesson
+
+
+@course_app.patch('/lesson/{lesson_id}/', response_model=LessonSchema)
+@query_budget(2)
+async def lesson_patch(lesson_id: int, lesson_data: LessonPatchSchema, db: Session = Depends(get_db)):
+    check_references(db, lesson_data.model_dump(exclude_unset=True))
+    lesson = patch_row(db, Lesson, lesson_id, lesson_data, live_query(db, Lesson))
+    lesson_flight.forget(tenant_key(lesson_id))
+    await publish_change(f'course-{lesson.course_id}', 'lesson.updated', LessonSchema, lesson)
     return lesson
 
 
 @course_app.delete('/lesson/{lesson_id}/', response_model=LessonSchema)
+@query_budget(2)
 async def lesson_delete(lesson_id: int, db: Session = Depends(get_db)):
-    lesson = db.query(Lesson).filter(Lesson.id==lesson_id).first()
+    lesson = live_query(db, Lesson).filter(Lesson.id==lesson_id).first()
     if lesson is None:
         raise HTTPException(status_code=404, detail='Lesson is not faund')
     db.delete(lesson)
     db.commit()
+    lesson_flight.forget(tenant_key(lesson_id))
     return lesson
 
 # Exam ------------------
 
 @course_app.post('/exam_post/', response_model=ExamSchema)
+@query_budget(3)
 async def exam_create(lesson: ExamSchema, db: Session = Depends(get_db)):
+     check_references(db, lesson.dict())
      db_exam = Exam(**lesson.dict())
      db.add(db_exam)
      db.commit()
      db.refresh(db_exam)
+     await publish_change(f'course-{db_exam.course_id}', 'exam.created', ExamSchema, db_exam)
      return db_exam
 
 
 @course_app.get("/exam/", response_model=List[ExamSchema])
+@query_budget(1)
 async def exam_get(db: Session = Depends(get_db)):
-    return db.query(Exam).all()
+    return live_query(db, Exam).all()
 
 
 @course_app.get('/exam/{exam_id}/', response_model=ExamSchema)
+@query_budget(1)
 async def exam_detail(exam_id: int,  db: Session = Depends(get_db)):
-    exam = db.query(Exam).filter(Exam.id==exam_id).first()
+    exam = live_query(db, Exam).filter(Exam.id==exam_id).first()
     if exam is None:
         raise HTTPException(status_code=404, detail='Exam is not faund')
     return exam
 
 
 @course_app.put('/exam/{exam_id}/', response_model=ExamSchema)
+@query_budget(4)
 async def exam_detail(exam_id: int, exam_data: ExamSchema, db: Session = Depends(get_db)):
-    exam = db.query(Exam).filter(Exam.id==exam_id).first()
+    exam = live_query(db, Exam).filter(Exam.id==exam_id).first()
     if exam is None:
         raise HTTPException(status_code=404, detail='Exam is not faund')
+    check_references(db, exam_data.dict(), exam)
     for key, value in exam_data.dict().items():
         setattr(exam, key, value)
     db.commit()
     db.refresh(exam)
+    await publish_change(f'exam-{exam.id}', 'exam.updated', ExamSchema, exam)
+    await publish_change(f'course-{exam.course_id}', 'exam.updated', ExamSchema, exam)
     return exam
 
 
 @course_app.delete('/exam/{exam_id}/', response_model=ExamSchema)
+@query_budget(2)
 async def exam_detail(exam_id: int, db: Session = Depends(get_db)):
-    exam = db.query(Exam).filter(Exam.id==exam_id).first()
+    exam = live_query(db, Exam).filter(Exam.id==exam_id).first()
     if exam is None:
         raise HTTPException(status_code=404, detail='Exam is not faund')
     db.delete(exam)
@@ -277,44 +582,62 @@ async def exam_detail(exam_id: int, db: Session = Depends(get_db)):
     return exam
 
 @course_app.post('/question/create/', response_model=QuestionSchema)
+@query_budget(3)
 async def create_question(question: QuestionSchema, db: Session = Depends(get_db)):
-    db_question = Question(**question.dict())
+    check_references(db, question.dict())
+    db_question = Question(**question.dict(exclude={'version'}))
     db.add(db_question)
     db.commit()
     db.refresh(db_question)
+    await publish_change(f'exam-{db_question.exam_id}', 'question.created', QuestionSchema, db_question)
     return db_question
 
 
 @course_app.get('/question/', response_model=List[QuestionSchema])
+@query_budget(1)
 async def list_question(db: Session = Depends(get_db)):
-    return db.query(Question).all()
+    return live_query(db, Question).all()
 
 
 @course_app.get('/question/{question_id}/', response_model=QuestionSchema)
+@query_budget(1)
 async def detail_question(question_id: int, db:Session = Depends(get_db)):
-    question = db.query(Question).filter(Question.id==question_id).first()
+    question = live_query(db, Question).filter(Question.id==question_id).first()
     if question is None:
         raise HTTPException(status_code=404, detail='Question not found')
     return question
 
 
 @course_app.put('/question/{question_id}/', response_model=QuestionSchema)
+@query_budget(4)
 async def update_question(question_id: int,
                         question_data: QuestionSchema,
                         db: Session = Depends(get_db)):
-    question = db.query(Question).filter(Question.id==question_id).first()
+    question = live_query(db, Question).filter(Question.id==question_id).first()
     if question is None:
         raise HTTPException(status_code=404, detail='Question not found')
-    for question_key, question_value in question_data.dict().items():
+    check_references(db, question_data.dict(), question)
+    for question_key, question_value in question_data.dict(exclude={'version'}).items():
         setattr(question, question_key, question_value)
     db.commit()
     db.refresh(question)
+    await publish_change(f'exam-{question.exam_id}', 'question.updated', QuestionSchema, question)
+    return question
+
+
+@course_app.patch('/question/{question_id}/', response_model=QuestionSchema)
+@query_budget(2)
+async def patch_question(question_id: int, question_data: QuestionPatchSchema, db: Session = Depends(get_db)):
+    check_references(db, question_data.model_dump(exclude_unset=True))
+    question = patch_row(db, Question, question_id, question_data, live_query(db, Question))
+    await publish_change(f'exam-{question.exam_id}', 'question.updated', QuestionSchema, question)
     return question
 
 
 @course_app.delete('/question/{question_id}')
+@query_budget(2)
 async def delete_question(question_id: int, db: Session = Depends(get_db)):
-    question = db.query(Question).filter(Question.id==question_id).first()
+    question = live_query(db, Question).filter(Question.id==question_id).first()
     if question is None:
         raise HTTPException(status_code=404, detail='Question not found')
     db.delete(question)
@@ -322,9 +645,11 @@ async def delete_question(question_id: int, db: Session = Depends(get_db)):
     return {'message': 'This Question is Deleted'}
 
 
-@course_app.post('/certificate/create/', response_model=CertificateSchema)
+@course_app.post('/certificate/create/', response_model=IssuedCertificateSchema)
+@query_budget(4)
 async def create_certificate(certificate: CertificateSchema, db: Session = Depends(get_db)):
-    db_certificate = Certificate(**certificate.dict())
+    check_references(db, certificate.dict())
+    db_certificate = Certificate(**certificate.dict(exclude={'version'}))
     db.add(db_certificate)
     db.commit()
     db.refresh(db_certificate)
@@ -332,37 +657,375 @@ async def create_certificate(certificate: CertificateSchema, db: Session = Depen
 
 
 @course_app.get('/certificate/', response_model=List[CertificateSchema])
+@query_budget(1)
 async def list_certificate(db: Session = Depends(get_db)):
-    return db.query(Certificate).all()
+    return live_query(db, Certificate).all()
+
+
+@course_app.get('/certificate/verify/{code}', response_model=CertificateSchema)
+@query_budget(1)
+async def verify_certificate(code: str, db: Session = Depends(get_db)):
+    for certificate_id in certificate_index.lookup(code):
+        certificate = live_query(db, Certificate).filter(Certificate.id==certificate_id,
+                                                         Certificate.verification_code==code).first()
+        if certificate is not None:
+            return certificate
+    raise HTTPException(status_code=404, detail='Certificate not found')
 
 
 @course_app.get('/certificate/{certificate_id}/', response_model=CertificateSchema)
+@query_budget(1)
 async def detail_certificate(certificate_id: int, db:Session = Depends(get_db)):
-    certificate = db.query(Certificate).filter(Certificate.id==certificate_id).first()
+    certificate = live_query(db, Certificate).filter(Certificate.id==certificate_id).first()
     if certificate is None:
         raise HTTPException(status_code=404, detail='Certificate not found')
     return certificate
 
 
 @course_app.put('/certificate/{certificate_id}/', response_model=CertificateSchema)
+@query_budget(5)
 async def update_certificate(certificate_id: int,
                         certificate_data: CertificateSchema,
                         db: Session = Depends(get_db)):
-    certificate = db.query(Certificate).filter(Certificate.id==certificate_id).first()
+    certificate = live_query(db, Certificate).filter(Certificate.id==certificate_id).first()
     if certificate is None:
         raise HTTPException(status_code=404, detail='Certificate not found')
-    for certificate_key, certificate_value in certificate_data.dict().items():
+    check_references(db, certificate_data.dict(), certificate)
+    for certificate_key, certificate_value in certificate_data.dict(exclude={'version'}).items():
         setattr(certificate, certificate_key, certificate_value)
     db.commit()
     db.refresh(certificate)
     return certificate
 
 
+@course_app.patch('/certificate/{certificate_id}/', response_model=CertificateSchema)
+@query_budget(3)
+async def patch_certificate(certificate_id: int, certificate_data: CertificatePatchSchema,
+                            db: Session = Depends(get_db)):
+    check_references(db, certificate_data.model_dump(exclude_unset=True))
+    return patch_row(db, Certificate, certificate_id, certificate_data,
+                     live_query(db, Certificate))
+
+
 @course_app.delete('/certificate/{certificate_id}')
+@query_budget(2)
 async def delete_certificate(certificate_id: int, db: Session = Depends(get_db)):
-    certificate = db.query(Certificate).filter(Certificate.id==certificate_id).first()
+    certificate = live_query(db, Certificate).filter(Certificate.id==certificate_id).first()
     if certificate is None:
         raise HTTPException(status_code=404, detail='Certificate not found')
     db.delete(certificate)
     db.commit()
     return {'message': 'This Certificate is Deleted'}
+
+
+# MEDIA-----------------------------
+
+
+async def store_upload(request: Request, prefix: str, allowed: tuple[str, ...]) -> str:
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type not in allowed:
+        raise HTTPException(status_code=415, detail='Unsupported media type')
+    key = prefix + (mimetypes.guess_extension(content_type) or '')
+    try:
+        await media_storage.save(key, limited(request.stream()))
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail='File is too large')
+    return key
+
+
+def drop_replaced(old_url: str | None, key: str):
+    if old_url and old_url.startswith(MEDIA_URL_PREFIX) and old_url != MEDIA_URL_PREFIX + key:
+        media_storage.delete(old_url[len(MEDIA_URL_PREFIX):])
+
+
+# Uploads can stream for minutes, so each route checks the row, ends the
+# transaction to hand its connection back to the pool, and loads the row
+# again once the file is stored.
+
+
+@course_app.put('/lesson/{lesson_id}/video/', response_model=LessonSchema)
+@query_budget(4)
+async def upload_lesson_video(lesson_id: int, request: Request, tasks: BackgroundTasks,
+                              db: Session = Depends(get_db)):
+    lessons = live_query(db, Lesson).filter(Lesson.id==lesson_id)
+    if lessons.with_entities(Lesson.id).first() is None:
+        raise HTTPException(status_code=404, detail='Lesson is not faund')
+    db.rollback()
+    key = await store_upload(request, f'lessons/{lesson_id}/video', MEDIA_VIDEO_TYPES)
+    lesson = lessons.first()
+    if lesson is None:
+        media_storage.delete(key)
+        raise HTTPException(status_code=404, detail='Lesson is not faund')
+    old_url, lesson.video_url = lesson.video_url, MEDIA_URL_PREFIX + key
+    db.commit()
+    drop_replaced(old_url, key)
+    db.refresh(lesson)
+    lesson_flight.forget(tenant_key(lesson_id))
+    tasks.add_task(make_video_poster, media_storage, key)
+    return lesson
+
+
+@course_app.put('/lesson/{lesson_id}/content/', response_model=LessonSchema)
+@query_budget(4)
+async def upload_lesson_content(lesson_id: int, request: Request, db: Session = Depends(get_db)):
+    lessons = live_query(db, Lesson).filter(Lesson.id==lesson_id)
+    if lessons.with_entities(Lesson.id).first() is None:
+        raise HTTPException(status_code=404, detail='Lesson is not faund')
+    db.rollback()
+    key = await store_upload(request, f'lessons/{lesson_id}/content', MEDIA_CONTENT_TYPES)
+    lesson = lessons.first()
+    if lesson is None:
+        media_storage.delete(key)
+        raise HTTPException(status_code=404, detail='Lesson is not faund')
+    old_url, lesson.content = lesson.content, MEDIA_URL_PREFIX + key
+    db.commit()
+    drop_replaced(old_url, key)
+    db.refresh(lesson)
+    lesson_flight.forget(tenant_key(lesson_id))
+    return lesson
+
+
+@course_app.put('/user/{user_id}/picture/')
+@query_budget(3)
+async def upload_profile_picture(user_id: int, request: Request, tasks: BackgroundTasks,
+                                 db: Session = Depends(get_db)):
+    users = db.query(UserProfile).filter(UserProfile.id==user_id)
+    if users.with_entities(UserProfile.id).first() is None:
+        raise HTTPException(status_code=404, detail='User not found')
+    db.rollback()
+    key = await store_upload(request, f'users/{user_id}/picture', MEDIA_IMAGE_TYPES)
+    user = users.first()
+    if user is None:
+        media_storage.delete(key)
+        raise HTTPException(status_code=404, detail='User not found')
+    old_url, user.profile_picture = user.profile_picture, MEDIA_URL_PREFIX + key
+    db.commit()
+    drop_replaced(old_url, key)
+    tasks.add_task(make_image_thumbnail, media_storage, key)
+    return {'profile_picture': MEDIA_URL_PREFIX + key}
+
+
+@course_app.get(MEDIA_URL_PREFIX + '{key:path}')
+@query_budget(0)
+def download_media(key: str, request: Request):
+    # Uploads share the API's origin, so never let a browser render them as a page.
+    response = media_storage.response(key, request.headers.get('range'))
+    response.headers['Content-Disposition'] = 'attachment'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+# EVENTS-----------------------------
+
+
+@course_app.get('/events/{topic}')
+@query_budget(0)
+async def event_stream(topic: str):
+    topic = tenant_topic(topic)
+    subscriber = event_bus.hub.subscribe(topic)
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if message is None:
+                    return
+                yield f'data: {message}\n\n'
+        finally:
+            event_bus.hub.unsubscribe(topic, subscriber)
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@course_app.websocket('/ws/{topic}')
+async def event_socket(websocket: WebSocket, topic: str):
+    # TenantMiddleware only sees HTTP requests, so resolve the school here.
+    try:
+        tenant_id = tenant_resolver.resolve(websocket)
+    except PermissionError:
+        tenant_id = None
+    if tenant_id is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    topic = f'{tenant_id}:{topic}'
+    subscriber = event_bus.hub.subscribe(topic)
+    try:
+        while (message := await subscriber.queue.get()) is not None:
+            await websocket.send_text(message)
+        await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_bus.hub.unsubscribe(topic, subscriber)
+
+
+# LEADERBOARD-----------------------------
+
+
+# Questions carry no answer key, so a teacher grades the attempt and posts
+# which questions were answered correctly.
+@course_app.post('/exam/{exam_id}/submit/', response_model=ExamAttemptSchema)
+@query_budget(7)
+async def submit_exam(exam_id: int, submission: ExamSubmissionSchema, db: Session = Depends(get_db),
+                      teacher: UserProfile = Depends(get_teacher)):
+    exam = live_query(db, Exam).filter(Exam.id==exam_id).first()
+    if exam is None:
+        raise HTTPException(status_code=404, detail='Exam is not faund')
+    student = db.query(UserProfile.id).filter(UserProfile.id==submission.student_id).first()
+    if student is None:
+        raise HTTPException(status_code=404, detail='Student not found')
+    score = db.query(func.coalesce(func.sum(Question.score), 0)).filter(
+        Question.exam_id==exam_id, Question.id.in_(submission.correct_question_ids)).scalar()
+    attempt = ExamAttempt(exam_id=exam_id, student_id=submission.student_id, score=score)
+    db.add(attempt)
+    db.commit()
+    db.refresh(attempt)
+    submitted = {'exam_id': exam_id, 'course_id': exam.course_id, 'student_id': attempt.student_id, 'score': score}
+    # Applying a best score twice is a no-op, so this worker updates its boards
+    # right away and the broker brings the other workers up to date.
+    leaderboards.apply(**submitted)
+    await event_bus.publish('leaderboard', 'attempt.submitted', submitted)
+    result = ExamAttemptSchema.model_validate(attempt)
+    result.rank = leaderboards.board('exam', exam_id).rank(attempt.student_id)
+    return result
+
+
+def get_board(kind: Literal['exam', 'course'], board_id: int, db: Session):
+    model = Exam if kind == 'exam' else Course
+    board = leaderboards.board(kind, board_id)
+    if board is None or live_query(db, model).with_entities(model.id).filter(model.id==board_id).first() is None:
+        raise HTTPException(status_code=404, detail='Leaderboard not found')
+    return board
+
+
+@course_app.get('/leaderboard/{kind}/{board_id}/', response_model=List[LeaderboardEntrySchema])
+@query_budget(1)
+async def leaderboard_top(kind: Literal['exam', 'course'], board_id: int, limit: int = 10,
+                          db: Session = Depends(get_db)):
+    return get_board(kind, board_id, db).top(min(limit, 100))
+
+
+@course_app.get('/leaderboard/{kind}/{board_id}/{student_id}/', response_model=LeaderboardEntrySchema)
+@query_budget(1)
+async def leaderboard_rank(kind: Literal['exam', 'course'], board_id: int, student_id: int,
+                           db: Session = Depends(get_db)):
+    board = get_board(kind, board_id, db)
+    rank = board.rank(student_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail='Student has no score on this leaderboard')
+    return {'rank': rank, 'student_id': student_id, 'score': board.scores[student_id]}
+
+
+@course_app.get('/leaderboard/{kind}/{board_id}/{student_id}/around/', response_model=List[LeaderboardEntrySchema])
+@query_budget(1)
+async def leaderboard_around(kind: Literal['exam', 'course'], board_id: int, student_id: int, size: int = 5,
+                             db: Session = Depends(get_db)):
+    return get_board(kind, board_id, db).around(student_id, min(size, 50))
+
+
+# CHECKOUT-----------------------------
+
+
+@course_app.post('/course/{course_id}/checkout/', response_model=OrderSchema, status_code=202)
+@query_budget(8)
+async def checkout(course_id: int, checkout_data: CheckoutSchema, db: Session = Depends(get_db)):
+    course = live_query(db, Course).filter(Course.id==course_id).first()
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    check_references(db, checkout_data.dict())
+    if course.type_course != TypeCourse.type2:
+        raise HTTPException(status_code=400, detail="Course is free")
+    enrolled = db.query(Enrollment).filter(Enrollment.student_id==checkout_data.student_id,
+                                           Enrollment.course_id==course_id).first()
+    if enrolled is not None:
+        raise HTTPException(status_code=409, detail="Already enrolled")
+    # A repeated checkout (a double click, a retry) gets the order that is
+    # already being charged instead of a second charge.
+    pending = db.query(Order).filter(Order.student_id==checkout_data.student_id, Order.course_id==course_id,
+                                     Order.status==OrderStatus.pending)
+    order = pending.first()
+    if order is not None:
+        return order
+    # The order, the payment and the request to charge it commit together;
+    # the provider is called later by the outbox dispatcher, not by this request.
+    order = Order(student_id=checkout_data.student_id, course_id=course_id, amount=course.price)
+    payment = Payment(order=order)
+    db.add_all([order, payment])
+    try:
+        db.flush()
+    except IntegrityError:
+        # uq_orders_pending: a concurrent checkout inserted its order first.
+        db.rollback()
+        return pending.one()
+    enqueue(db, CHARGE_PAYMENT, {'payment_id': payment.id})
+    db.commit()
+    db.refresh(order)
+    return order
+
+
+@course_app.get('/order/{order_id}/', response_model=OrderSchema)
+@query_budget(1)
+async def detail_order(order_id: int, db: Session = Depends(get_db)):
+    # Joining the course applies its tenant filter.
+    order = db.query(Order).join(Course).filter(Order.id==order_id).first()
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+@course_app.post('/payments/webhook/')
+@query_budget(6)
+async def payment_webhook(request: Request, db: Session = Depends(get_db)):
+    # Unsigned webhooks would let anyone mark an order paid.
+    if not PAYMENT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Payment webhooks are not configured")
+    body = await request.body()
+    expected = hmac.new(PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, request.headers.get('x-signature', '')):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    try:
+        event = PaymentWebhookSchema.model_validate_json(body)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    payment = db.query(Payment).filter(Payment.provider_reference==event.reference).with_for_update().first()
+    if payment is None:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    settle_payment(db, payment, event.status)
+    db.commit()
+    return {'status': payment.status}
+
+
+# AUDIT-----------------------------
+
+
+@course_app.get('/audit/', response_model=AuditPageSchema)
+@query_budget(2)
+async def list_audit_events(entity: str | None = None, entity_id: int | None = None, actor: str | None = None,
+                            cursor: str | None = None, limit: int = AUDIT_PAGE_SIZE, db: Session = Depends(get_db),
+                            teacher: UserProfile = Depends(get_teacher)):
+    # Newest first. The cursor is the (occurred_at, id) of the last event on the
+    # previous page, so each page is an index range scan instead of an OFFSET.
+    query = db.query(AuditEvent).filter(AuditEvent.tenant_id==current_tenant.get())
+    if entity is not None:
+        query = query.filter(AuditEvent.entity==entity)
+    if entity_id is not None:
+        query = query.filter(AuditEvent.entity_id==entity_id)
+    if actor is not None:
+        query = query.filter(AuditEvent.actor==actor)
+    if cursor is not None:
+        try:
+            occurred_at, _, event_id = cursor.rpartition(',')
+            after = (datetime.fromisoformat(occurred_at), int(event_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+        query = query.filter(tuple_(AuditEvent.occurred_at, AuditEvent.id) < after)
+    limit = max(1, min(limit, 200))
+    events = query.order_by(AuditEvent.occurred_at.desc(), AuditEvent.id.desc()).limit(limit).all()
+    next_cursor = f'{events[-1].occurred_at.isoformat()},{events[-1].id}' if len(events) == limit else None
+    return {'events': events, 'next_cursor': next_cursor}
@@ -0,0 +1,40 @@
+import io
+import logging
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from storage import Storage
+from config import THUMBNAIL_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_key(key: str) -> str:
+    return f"{Path(key).parent}/thumbnail.jpg"
+
+
+def make_image_thumbnail(storage: Storage, key: str):
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed, skipping thumbnail for %s", key)
+        return
+    with storage.local_copy(key) as path, Image.open(path) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=85)
+    storage.put_bytes(thumbnail_key(key), output.getvalue())
+
+
+def make_video_poster(storage: Storage, key: str):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        logger.warning("ffmpeg is not installed, skipping poster for %s", key)
+        return
+    with storage.local_copy(key) as path, tempfile.TemporaryDirectory() as workdir:
+        poster = Path(workdir) / "poster.jpg"
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-ss", "1", "-i", str(path), "-frames:v", "1",
+                        "-vf", f"scale={THUMBNAIL_SIZE[0]}:-2", str(poster)], check=True, timeout=120)
+        storage.put_bytes(thumbnail_key(key), poster.read_bytes())
@@ -1,5 +1,6 @@
 from logging.config import fileConfig
 from models import *
+from config import DB_URL
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
@@ -8,6 +9,7 @@ from alembic import context
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
+config.set_main_option("sqlalchemy.url", DB_URL)
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -0,0 +1,46 @@
+"""course categories and similar courses table
+
+Revision ID: 2f8b5d7a1c64
+Revises: e6a4c0b3f817
+Create Date: 2026-10-19 13:21:48.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f8b5d7a1c64'
+down_revision: Union[str, None] = 'e6a4c0b3f817'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('courses', sa.Column('category_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_courses_category_id'), 'courses', ['category_id'], unique=False)
+    op.create_foreign_key('courses_category_id_fkey', 'courses', 'categories', ['category_id'], ['id'])
+    op.create_table('course_similarities',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('similar_course_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ),
+    sa.ForeignKeyConstraint(['similar_course_id'], ['courses.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_course_similarities_course_id'), 'course_similarities', ['course_id'], unique=False)
+    op.create_index(op.f('ix_course_similarities_similar_course_id'), 'course_similarities',
+                    ['similar_course_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_course_similarities_similar_course_id'), table_name='course_similarities')
+    op.drop_index(op.f('ix_course_similarities_course_id'), table_name='course_similarities')
+    op.drop_table('course_similarities')
+    op.drop_constraint('courses_category_id_fkey', 'courses', type_='foreignkey')
+    op.drop_index(op.f('ix_courses_category_id'), table_name='courses')
+    op.drop_column('courses', 'category_id')
@@ -0,0 +1,39 @@
+"""certificate verification codes
+
+Revision ID: 3e8c1b7f4a92
+Revises: 5a9f1e2d6b08
+Create Date: 2026-10-19 17:02:36.418205
+
+"""
+import secrets
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8c1b7f4a92'
+down_revision: Union[str, None] = '5a9f1e2d6b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('certificates', sa.Column('verification_code', sa.String(length=32), nullable=True))
+    certificates = sa.table('certificates', sa.column('id', sa.Integer), sa.column('verification_code', sa.String))
+    connection = op.get_bind()
+    ids = connection.execute(sa.select(certificates.c.id)).scalars().all()
+    if ids:
+        connection.execute(
+            certificates.update().where(certificates.c.id == sa.bindparam('certificate_id'))
+            .values(verification_code=sa.bindparam('code')),
+            [{'certificate_id': certificate_id, 'code': secrets.token_urlsafe(12)} for certificate_id in ids],
+        )
+    op.alter_column('certificates', 'verification_code', nullable=False)
+    op.create_unique_constraint('certificates_verification_code_key', 'certificates', ['verification_code'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('certificates_verification_code_key', 'certificates', type_='unique')
+    op.drop_column('certificates', 'verification_code')
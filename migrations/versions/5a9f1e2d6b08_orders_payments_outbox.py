@@ -0,0 +1,86 @@
+"""orders, payments, enrollments and outbox
+
+Revision ID: 5a9f1e2d6b08
+Revises: 7c0e9a4b3d21
+Create Date: 2026-10-19 15:48:11.075231
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9f1e2d6b08'
+down_revision: Union[str, None] = '7c0e9a4b3d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.DECIMAL(precision=8, scale=2), nullable=False),
+    sa.Column('status', sa.Enum('pending', 'paid', 'failed', name='orderstatus'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['user_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_orders_course_id'), 'orders', ['course_id'], unique=False)
+    op.create_index(op.f('ix_orders_student_id'), 'orders', ['student_id'], unique=False)
+    op.create_table('payments',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Enum('pending', 'succeeded', 'failed', name='paymentstatus'), nullable=False),
+    sa.Column('provider_reference', sa.String(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('order_id'),
+    sa.UniqueConstraint('provider_reference')
+    )
+    op.create_table('enrollments',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['user_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('student_id', 'course_id')
+    )
+    op.create_index(op.f('ix_enrollments_course_id'), 'enrollments', ['course_id'], unique=False)
+    op.create_table('outbox_events',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('topic', sa.String(length=64), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Only undelivered events are ever scanned, so the index stays small.
+    op.create_index('ix_outbox_events_due', 'outbox_events', ['next_attempt_at'], unique=False,
+                    postgresql_where=sa.text('processed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_events_due', table_name='outbox_events')
+    op.drop_table('outbox_events')
+    op.drop_index(op.f('ix_enrollments_course_id'), table_name='enrollments')
+    op.drop_table('enrollments')
+    op.drop_table('payments')
+    op.drop_index(op.f('ix_orders_student_id'), table_name='orders')
+    op.drop_index(op.f('ix_orders_course_id'), table_name='orders')
+    op.drop_table('orders')
+    sa.Enum(name='paymentstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='orderstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,66 @@
+"""tenants and tenant-scoped categories, courses and users
+
+Revision ID: 6d2a9c4e8f15
+Revises: 8b4d2f6e1a37
+Create Date: 2026-10-19 19:24:07.331842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d2a9c4e8f15'
+down_revision: Union[str, None] = '8b4d2f6e1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TENANT_TABLES = ['user_profiles', 'categories', 'courses']
+
+
+def upgrade() -> None:
+    op.create_table('tenants',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('host', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('host')
+    )
+    # Existing rows belong to the school that ran the site before tenants existed.
+    op.execute("INSERT INTO tenants (id, name, created_at) VALUES (1, 'default', now())")
+    op.execute("SELECT setval(pg_get_serial_sequence('tenants', 'id'), 1)")
+    for table in TENANT_TABLES:
+        op.add_column(table, sa.Column('tenant_id', sa.Integer(), nullable=True))
+        op.execute(f"UPDATE {table} SET tenant_id = 1")
+        op.alter_column(table, 'tenant_id', nullable=False)
+        op.create_foreign_key(f'{table}_tenant_id_fkey', table, 'tenants', ['tenant_id'], ['id'])
+
+    op.drop_constraint('user_profiles_username_key', 'user_profiles', type_='unique')
+    op.create_unique_constraint('user_profiles_tenant_id_username_key', 'user_profiles', ['tenant_id', 'username'])
+    op.drop_index('ix_categories_category_name', table_name='categories')
+    op.create_index('ix_categories_category_name', 'categories', ['category_name'], unique=False)
+    op.create_unique_constraint('categories_tenant_id_category_name_key', 'categories',
+                                ['tenant_id', 'category_name'])
+    op.create_index('ix_categories_tenant_live', 'categories', ['tenant_id', 'id'],
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_courses_tenant_live', 'courses', ['tenant_id', 'id'],
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_courses_tenant_category', 'courses', ['tenant_id', 'category_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_courses_tenant_category', table_name='courses')
+    op.drop_index('ix_courses_tenant_live', table_name='courses')
+    op.drop_index('ix_categories_tenant_live', table_name='categories')
+    op.drop_constraint('categories_tenant_id_category_name_key', 'categories', type_='unique')
+    op.drop_index('ix_categories_category_name', table_name='categories')
+    op.create_index('ix_categories_category_name', 'categories', ['category_name'], unique=True)
+    op.drop_constraint('user_profiles_tenant_id_username_key', 'user_profiles', type_='unique')
+    op.create_unique_constraint('user_profiles_username_key', 'user_profiles', ['username'])
+    for table in TENANT_TABLES:
+        op.drop_constraint(f'{table}_tenant_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'tenant_id')
+    op.drop_table('tenants')
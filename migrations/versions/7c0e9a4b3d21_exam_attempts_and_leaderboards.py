@@ -0,0 +1,55 @@
+"""exam attempts and leaderboard snapshots
+
+Revision ID: 7c0e9a4b3d21
+Revises: 2f8b5d7a1c64
+Create Date: 2026-10-19 14:37:52.210569
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c0e9a4b3d21'
+down_revision: Union[str, None] = '2f8b5d7a1c64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('exam_attempts',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('exam_id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.Column('submitted_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['exam_id'], ['exams.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['user_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_exam_attempts_exam_id'), 'exam_attempts', ['exam_id'], unique=False)
+    op.create_index(op.f('ix_exam_attempts_student_id'), 'exam_attempts', ['student_id'], unique=False)
+    op.create_index(op.f('ix_exam_attempts_submitted_at'), 'exam_attempts', ['submitted_at'], unique=False)
+    op.create_table('leaderboard_snapshots',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('exam_id', sa.Integer(), nullable=False),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['exam_id'], ['exams.id'], ),
+    sa.ForeignKeyConstraint(['student_id'], ['user_profiles.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('exam_id', 'student_id')
+    )
+    op.create_index(op.f('ix_leaderboard_snapshots_taken_at'), 'leaderboard_snapshots', ['taken_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_leaderboard_snapshots_taken_at'), table_name='leaderboard_snapshots')
+    op.drop_table('leaderboard_snapshots')
+    op.drop_index(op.f('ix_exam_attempts_submitted_at'), table_name='exam_attempts')
+    op.drop_index(op.f('ix_exam_attempts_student_id'), table_name='exam_attempts')
+    op.drop_index(op.f('ix_exam_attempts_exam_id'), table_name='exam_attempts')
+    op.drop_table('exam_attempts')
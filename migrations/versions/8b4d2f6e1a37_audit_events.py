@@ -0,0 +1,43 @@
+"""audit events, partitioned by month
+
+Revision ID: 8b4d2f6e1a37
+Revises: 3e8c1b7f4a92
+Create Date: 2026-10-19 18:11:52.604917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4d2f6e1a37'
+down_revision: Union[str, None] = '3e8c1b7f4a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Alembic cannot declare a partitioned table. Monthly partitions are created
+    # ahead of time by audit.ensure_partitions; the default one catches the rest.
+    op.execute("""
+        CREATE TABLE audit_events (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+            occurred_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            actor VARCHAR(40),
+            source VARCHAR(16) NOT NULL,
+            action VARCHAR(16) NOT NULL,
+            entity VARCHAR(40) NOT NULL,
+            entity_id INTEGER NOT NULL,
+            changes JSON,
+            PRIMARY KEY (id, occurred_at)
+        ) PARTITION BY RANGE (occurred_at)
+    """)
+    op.execute("CREATE INDEX ix_audit_events_entity ON audit_events (entity, entity_id, occurred_at)")
+    op.execute("CREATE INDEX ix_audit_events_occurred_at_id ON audit_events (occurred_at, id)")
+    op.execute("CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE audit_events")
@@ -0,0 +1,32 @@
+"""soft delete courses and categories
+
+Revision ID: 9d31f6a8e2c5
+Revises: 4b7e2c91d0a3
+Create Date: 2026-10-19 10:02:17.733912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d31f6a8e2c5'
+down_revision: Union[str, None] = '4b7e2c91d0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('categories', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_categories_deleted_at'), 'categories', ['deleted_at'], unique=False)
+    op.add_column('courses', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_courses_deleted_at'), 'courses', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_courses_deleted_at'), table_name='courses')
+    op.drop_column('courses', 'deleted_at')
+    op.drop_index(op.f('ix_categories_deleted_at'), table_name='categories')
+    op.drop_column('categories', 'deleted_at')
@@ -0,0 +1,29 @@
+"""pending idempotency keys
+
+Revision ID: a7c3e9d15b42
+Revises: 6d2a9c4e8f15
+Create Date: 2026-10-19 21:02:13.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d15b42'
+down_revision: Union[str, None] = '6d2a9c4e8f15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('idempotency_keys', 'status_code', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('idempotency_keys', 'body', existing_type=sa.LargeBinary(), nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM idempotency_keys WHERE status_code IS NULL")
+    op.alter_column('idempotency_keys', 'body', existing_type=sa.LargeBinary(), nullable=False)
+    op.alter_column('idempotency_keys', 'status_code', existing_type=sa.Integer(), nullable=False)
@@ -0,0 +1,28 @@
+"""unique course similarity rank
+
+Revision ID: c5e1a8f27d93
+Revises: a7c3e9d15b42
+Create Date: 2026-10-19 21:34:52.140377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e1a8f27d93'
+down_revision: Union[str, None] = 'a7c3e9d15b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Concurrent rebuilds may already have left duplicate neighbour rows.
+    op.execute("DELETE FROM course_similarities a USING course_similarities b "
+               "WHERE a.course_id = b.course_id AND a.rank = b.rank AND a.id > b.id")
+    op.create_unique_constraint('uq_course_similarities_course_rank', 'course_similarities', ['course_id', 'rank'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_course_similarities_course_rank', 'course_similarities', type_='unique')
@@ -0,0 +1,39 @@
+"""audit event tenants
+
+Revision ID: e2b7d4a90c16
+Revises: c5e1a8f27d93
+Create Date: 2026-10-19 22:11:40.682913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7d4a90c16'
+down_revision: Union[str, None] = 'c5e1a8f27d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# How to find the school of each audited entity.
+BACKFILL = {
+    'courses': "SELECT id, tenant_id FROM courses",
+    'lessons': "SELECT l.id, c.tenant_id FROM lessons l JOIN courses c ON c.id = l.course_id",
+    'exams': "SELECT e.id, c.tenant_id FROM exams e JOIN courses c ON c.id = e.course_id",
+    'certificates': "SELECT x.id, c.tenant_id FROM certificates x JOIN courses c ON c.id = x.course_id",
+}
+
+
+def upgrade() -> None:
+    # audit_events is partitioned, so this goes through raw SQL like its creation did.
+    op.execute("ALTER TABLE audit_events ADD COLUMN tenant_id INTEGER")
+    for entity, owners in BACKFILL.items():
+        op.execute(f"UPDATE audit_events a SET tenant_id = o.tenant_id FROM ({owners}) o(id, tenant_id) "
+                   f"WHERE a.entity = '{entity}' AND a.entity_id = o.id")
+    op.execute("CREATE INDEX ix_audit_events_tenant ON audit_events (tenant_id, occurred_at, id)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX ix_audit_events_tenant")
+    op.execute("ALTER TABLE audit_events DROP COLUMN tenant_id")
@@ -0,0 +1,30 @@
+"""row versions for optimistic concurrency
+
+Revision ID: e6a4c0b3f817
+Revises: 9d31f6a8e2c5
+Create Date: 2026-10-19 11:40:05.162384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a4c0b3f817'
+down_revision: Union[str, None] = '9d31f6a8e2c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['courses', 'lessons', 'questions', 'certificates']
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, 'version')
@@ -0,0 +1,29 @@
+"""unique pending orders
+
+Revision ID: f3a8c6d15e27
+Revises: e2b7d4a90c16
+Create Date: 2026-10-19 23:05:17.394021
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8c6d15e27'
+down_revision: Union[str, None] = 'e2b7d4a90c16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Fails if double checkouts already left two pending orders for the same
+    # student and course; those have to be settled by hand first.
+    op.create_index('uq_orders_pending', 'orders', ['student_id', 'course_id'], unique=True,
+                    postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    op.drop_index('uq_orders_pending', table_name='orders')
@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Text, DECIMAL, Enum
-from sqlalchemy.orm import relationship, Mapped, mapped_column, DeclarativeBase
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Text, DECIMAL, Enum, LargeBinary, \
+Float, UniqueConstraint, JSON, Index, text, BigInteger, Identity
+from sqlalchemy.orm import relationship, Mapped, mapped_column, DeclarativeBase, declared_attr
+import secrets
 from datetime import datetime
 from typing import Optional, List
 from database import Base
 from enum import Enum as PyEnum
 from passlib.hash import bcrypt
+from config import CERTIFICATE_CODE_BYTES
 
 
 class UserRole(str, PyEnum):
@@ -23,13 +26,46 @@ class TypeCourse(str, PyEnum):
     type2 = 'платный'
 
 
-class UserProfile(Base):
+class OrderStatus(str, PyEnum):
+    pending = 'pending'
+    paid = 'paid'
+    failed = 'failed'
+
+
+class PaymentStatus(str, PyEnum):
+    pending = 'pending'
+    succeeded = 'succeeded'
+    failed = 'failed'
+
+
+class Tenant(Base):
+    __tablename__ = "tenants"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(100))
+    host: Mapped[Optional[str]] = mapped_column(String(255), unique=True, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class TenantScoped:
+    """Rows owned by one school. Queries are filtered to the request's tenant in tenancy.py."""
+
+    tenant_id: Mapped[int] = mapped_column(ForeignKey("tenants.id"))
+
+    # Lets the admin, which works across schools, pick the tenant in its forms.
+    @declared_attr
+    def tenant(cls) -> Mapped["Tenant"]:
+        return relationship("Tenant")
+
+
+class UserProfile(TenantScoped, Base):
     __tablename__ = "user_profiles"
+    __table_args__ = (UniqueConstraint("tenant_id", "username"),)
 
     id: Mapped[int] = mapped_column(autoincrement=True, primary_key=True)
     first_name: Mapped[str] = mapped_column(String(40))
     last_name: Mapped[str] = mapped_column(String(40))
-    username: Mapped[str] = mapped_column(String(40), unique=True)
+    username: Mapped[str] = mapped_column(String(40))
     password: Mapped[str] = mapped_column(String, nullable=False)
     phone_number: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     age: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
@@ -47,15 +83,21 @@ class UserProfile(Base):
         return bcrypt.verify(password, self.password)
 
 
-class Category(Base):
+class Category(TenantScoped, Base):
     __tablename__ = "categories"
+    __table_args__ = (UniqueConstraint("tenant_id", "category_name"),
+                      Index("ix_categories_tenant_live", "tenant_id", "id",
+                            postgresql_where=text("deleted_at IS NULL")))
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    category_name: Mapped[str] = mapped_column(String, unique=True, index=True)
+    category_name: Mapped[str] = mapped_column(String, index=True)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
 
 
-class Course(Base):
+class Course(TenantScoped, Base):
     __tablename__ = "courses"
+    __table_args__ = (Index("ix_courses_tenant_live", "tenant_id", "id", postgresql_where=text("deleted_at IS NULL")),
+                      Index("ix_courses_tenant_category", "tenant_id", "category_id"))
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     course_name: Mapped[str] = mapped_column(String, index=True)
@@ -66,8 +108,14 @@ class Course(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id: Mapped[int] = mapped_column(ForeignKey("user_profiles.id"))
+    category_id: Mapped[Optional[int]] = mapped_column(ForeignKey("categories.id"), nullable=True, index=True)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {"version_id_col": version}
 
     author: Mapped["UserProfile"] = relationship("UserProfile", back_populates="courses")
+    category: Mapped[Optional["Category"]] = relationship("Category")
 
 
 class Lesson(Base):
@@ -78,6 +126,9 @@ class Lesson(Base):
     video_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     content: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"))
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Exam(Base):
@@ -96,6 +147,13 @@ class Question(Base):
     exam_id: Mapped[int] = mapped_column(ForeignKey("exams.id"))
     title: Mapped[str] = mapped_column(String, index=True)
     score: Mapped[int] = mapped_column(Integer)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+def new_verification_code() -> str:
+    return secrets.token_urlsafe(CERTIFICATE_CODE_BYTES)
 
 
 class Certificate(Base):
@@ -106,6 +164,10 @@ class Certificate(Base):
     course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"))
     issued_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     certificate_url: Mapped[str] = mapped_column(String)
+    verification_code: Mapped[str] = mapped_column(String(32), unique=True, default=new_verification_code)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {"version_id_col": version}
 
 
 class RefreshToken(Base):
@@ -115,4 +177,124 @@ class RefreshToken(Base):
     token: Mapped[str] = mapped_column(String, nullable=False)
     created_date: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     user_id: Mapped[int] = mapped_column(ForeignKey("user_profiles.id"))
-    user: Mapped["UserProfile"] = relationship("UserProfile", back_populates="tokens")
\ No newline at end of file
+    user: Mapped["UserProfile"] = relationship("UserProfile", back_populates="tokens")
+
+
+class CourseSimilarity(Base):
+    __tablename__ = "course_similarities"
+    __table_args__ = (UniqueConstraint("course_id", "rank", name="uq_course_similarities_course_rank"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"), index=True)
+    similar_course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"), index=True)
+    rank: Mapped[int] = mapped_column(Integer)
+    score: Mapped[float] = mapped_column(Float)
+
+
+class ExamAttempt(Base):
+    __tablename__ = "exam_attempts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    exam_id: Mapped[int] = mapped_column(ForeignKey("exams.id"), index=True)
+    student_id: Mapped[int] = mapped_column(ForeignKey("user_profiles.id"), index=True)
+    score: Mapped[int] = mapped_column(Integer)
+    submitted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+class LeaderboardSnapshot(Base):
+    __tablename__ = "leaderboard_snapshots"
+    __table_args__ = (UniqueConstraint("exam_id", "student_id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    exam_id: Mapped[int] = mapped_column(ForeignKey("exams.id"))
+    student_id: Mapped[int] = mapped_column(ForeignKey("user_profiles.id"))
+    score: Mapped[int] = mapped_column(Integer)
+    taken_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class Order(Base):
+    __tablename__ = "orders"
+    # One unpaid order per student and course, so a repeated checkout cannot charge twice.
+    __table_args__ = (Index("uq_orders_pending", "student_id", "course_id", unique=True,
+                            postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    student_id: Mapped[int] = mapped_column(ForeignKey("user_profiles.id"), index=True)
+    course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"), index=True)
+    amount: Mapped[DECIMAL] = mapped_column(DECIMAL(8, 2))
+    status: Mapped[OrderStatus] = mapped_column(Enum(OrderStatus), default=OrderStatus.pending)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    payment: Mapped["Payment"] = relationship("Payment", back_populates="order", uselist=False)
+
+
+class Payment(Base):
+    __tablename__ = "payments"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id"), unique=True)
+    status: Mapped[PaymentStatus] = mapped_column(Enum(PaymentStatus), default=PaymentStatus.pending)
+    provider_reference: Mapped[Optional[str]] = mapped_column(String, nullable=True, unique=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    order: Mapped["Order"] = relationship("Order", back_populates="payment")
+
+
+class Enrollment(Base):
+    __tablename__ = "enrollments"
+    __table_args__ = (UniqueConstraint("student_id", "course_id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    student_id: Mapped[int] = mapped_column(ForeignKey("user_profiles.id"))
+    course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"), index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (Index("ix_outbox_events_due", "next_attempt_at", postgresql_where=text("processed_at IS NULL")),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    topic: Mapped[str] = mapped_column(String(64))
+    payload: Mapped[dict] = mapped_column(JSON)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+    # Both NULL while the request holding the key is still running.
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    media_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+    __table_args__ = (Index("ix_audit_events_entity", "entity", "entity_id", "occurred_at"),
+                      Index("ix_audit_events_occurred_at_id", "occurred_at", "id"),
+                      Index("ix_audit_events_tenant", "tenant_id", "occurred_at", "id"),
+                      {"postgresql_partition_by": "RANGE (occurred_at)"})
+
+    # Partitioned by month on occurred_at, which therefore has to be part of the key.
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    occurred_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    # School of the changed row; NULL for changes made outside any school.
+    tenant_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    actor: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    source: Mapped[str] = mapped_column(String(16))
+    action: Mapped[str] = mapped_column(String(16))
+    entity: Mapped[str] = mapped_column(String(40))
+    entity_id: Mapped[int] = mapped_column(Integer)
+    changes: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
@@ -0,0 +1,124 @@
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import OutboxEvent, Payment, Enrollment, OrderStatus, PaymentStatus
+from payments import PaymentGateway
+from config import OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_BASE_BACKOFF_SECONDS, OUTBOX_MAX_BACKOFF_SECONDS, \
+    OUTBOX_LEASE_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+CHARGE_PAYMENT = "payment.charge"
+
+
+def enqueue(db: Session, topic: str, payload: dict) -> OutboxEvent:
+    """Add an event in the caller's transaction; it is sent only if that commits."""
+    event = OutboxEvent(topic=topic, payload=payload)
+    db.add(event)
+    return event
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def settle_payment(db: Session, payment: Payment, status: PaymentStatus, reference: Optional[str] = None):
+    if payment.status != PaymentStatus.pending:
+        return
+    payment.status = status
+    if reference is not None:
+        payment.provider_reference = reference
+    order = payment.order
+    if status == PaymentStatus.succeeded:
+        order.status = OrderStatus.paid
+        db.execute(insert(Enrollment).values(student_id=order.student_id, course_id=order.course_id)
+                   .on_conflict_do_nothing(index_elements=[Enrollment.student_id, Enrollment.course_id]))
+    elif status == PaymentStatus.failed:
+        order.status = OrderStatus.failed
+
+
+def charge_payment(db: Session, gateway: PaymentGateway, payload: dict):
+    payment = db.get(Payment, payload["payment_id"])
+    if payment is None or payment.status != PaymentStatus.pending:
+        return
+    payment_id, amount = payment.id, payment.order.amount
+    # The provider can take seconds to answer; don't hold a connection meanwhile.
+    db.commit()
+    result = gateway.charge(payment_id, amount)
+    payment = db.get(Payment, payment_id, with_for_update=True, populate_existing=True)
+    # A pending charge is settled later by the provider's webhook.
+    settle_payment(db, payment, result.status, result.reference)
+
+
+HANDLERS: dict[str, Callable[[Session, PaymentGateway, dict], None]] = {
+    CHARGE_PAYMENT: charge_payment,
+}
+
+
+def give_up(db: Session, event: OutboxEvent):
+    if event.topic == CHARGE_PAYMENT:
+        payment = db.get(Payment, event.payload["payment_id"])
+        if payment is not None:
+            payment.last_error = event.last_error
+            settle_payment(db, payment, PaymentStatus.failed)
+
+
+def dispatch_outbox(gateway: PaymentGateway, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Send one batch of due events.
+
+    The batch is claimed with SKIP LOCKED in a short transaction that pushes
+    `next_attempt_at` out by a lease, so other workers skip it while it is
+    sent. If this worker dies, the events are due again once the lease ends.
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        events = db.scalars(
+            select(OutboxEvent)
+            .where(OutboxEvent.processed_at.is_(None), OutboxEvent.next_attempt_at <= now)
+            .order_by(OutboxEvent.next_attempt_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        claimed = [(event.id, event.topic, event.payload) for event in events]
+        for event in events:
+            event.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        db.commit()
+    for event_id, topic, payload in claimed:
+        process_event(gateway, event_id, topic, payload)
+    return len(claimed)
+
+
+def process_event(gateway: PaymentGateway, event_id: int, topic: str, payload: dict):
+    with SessionLocal() as db:
+        try:
+            HANDLERS[topic](db, gateway, payload)
+        except Exception as exc:
+            db.rollback()
+            logger.warning("Outbox event %s failed: %s", event_id, exc)
+            event = db.get(OutboxEvent, event_id)
+            event.attempts += 1
+            event.last_error = str(exc)
+            if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                event.processed_at = datetime.utcnow()
+                give_up(db, event)
+            else:
+                event.next_attempt_at = datetime.utcnow() + backoff(event.attempts)
+        else:
+            db.get(OutboxEvent, event_id).processed_at = datetime.utcnow()
+        db.commit()
+
+
+def drain_outbox(gateway: PaymentGateway, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    total = 0
+    while (sent := dispatch_outbox(gateway, batch_size)) > 0:
+        total += sent
+        if sent < batch_size:
+            break
+    return total
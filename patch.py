@@ -0,0 +1,37 @@
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlalchemy.orm import Query, Session
+from audit import AUDITED_MODELS, stage
+
+
+def patch_row(db: Session, model, row_id: int, data: BaseModel, visible: Query):
+    """Write only the fields the client sent, in a single UPDATE ... RETURNING.
+
+    Only rows returned by `visible` can be written. The row must still be at
+    `data.version`; otherwise nothing is written and 409 is raised, so
+    concurrent edits are never silently overwritten.
+    """
+    values = data.model_dump(exclude_unset=True, exclude={'version'})
+    for key, value in values.items():
+        if value is None and not model.__mapper__.columns[key].nullable:
+            raise HTTPException(status_code=422, detail=f'{key} cannot be null')
+    visible = visible.with_entities(model.id).filter(model.id == row_id)
+    statement = (
+        update(model)
+        .where(model.id.in_(visible.scalar_subquery()), model.version == data.version)
+        .values(**values, version=model.version + 1)
+        .returning(*model.__table__.c)
+        .execution_options(synchronize_session=False)
+    )
+    row = db.execute(statement).first()
+    if row is None:
+        db.rollback()
+        if visible.first() is None:
+            raise HTTPException(status_code=404, detail=f'{model.__name__} not found')
+        raise HTTPException(status_code=409, detail=f'{model.__name__} was changed by another request')
+    if issubclass(model, AUDITED_MODELS):
+        # Bulk UPDATE skips the ORM flush hooks, and the old values are not read.
+        stage(db, 'update', model, row_id, {key: [None, value] for key, value in values.items()})
+    db.commit()
+    return row
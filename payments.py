@@ -0,0 +1,60 @@
+import uuid
+from decimal import Decimal
+from typing import NamedTuple
+from models import PaymentStatus
+from config import PAYMENT_GATEWAY_URL, PAYMENT_GATEWAY_KEY, PAYMENT_CURRENCY, PAYMENT_TIMEOUT_SECONDS
+
+
+class PaymentError(Exception):
+    """The provider could not be reached or answered with an error; retry later."""
+
+
+class ChargeResult(NamedTuple):
+    status: PaymentStatus
+    reference: str
+
+
+class PaymentGateway:
+    def charge(self, payment_id: int, amount: Decimal, currency: str = PAYMENT_CURRENCY) -> ChargeResult:
+        raise NotImplementedError
+
+
+class HttpPaymentGateway(PaymentGateway):
+    def __init__(self, url: str, api_key: str | None = None, timeout: float = PAYMENT_TIMEOUT_SECONDS):
+        import httpx
+        self.client = httpx.Client(base_url=url, timeout=timeout,
+                                   headers={"Authorization": f"Bearer {api_key}"} if api_key else {})
+
+    def charge(self, payment_id: int, amount: Decimal, currency: str = PAYMENT_CURRENCY) -> ChargeResult:
+        import httpx
+        try:
+            response = self.client.post("/charges", json={"amount": str(amount), "currency": currency},
+                                        headers={"Idempotency-Key": f"payment-{payment_id}"})
+            response.raise_for_status()
+            data = response.json()
+            return ChargeResult(PaymentStatus(data["status"]), data["reference"])
+        except (httpx.HTTPError, KeyError, ValueError) as exc:
+            raise PaymentError(str(exc)) from exc
+
+
+class FakePaymentGateway(PaymentGateway):
+    """Local stand-in: succeeds unless told to fail `failures` times first or to decline."""
+
+    def __init__(self, failures: int = 0, status: PaymentStatus = PaymentStatus.succeeded):
+        self.failures = failures
+        self.status = status
+        self.charges: dict[int, ChargeResult] = {}
+
+    def charge(self, payment_id: int, amount: Decimal, currency: str = PAYMENT_CURRENCY) -> ChargeResult:
+        if self.failures > 0:
+            self.failures -= 1
+            raise PaymentError("fake gateway unavailable")
+        if payment_id not in self.charges:
+            self.charges[payment_id] = ChargeResult(self.status, f"fake-{uuid.uuid4().hex}")
+        return self.charges[payment_id]
+
+
+def get_payment_gateway() -> PaymentGateway:
+    if PAYMENT_GATEWAY_URL:
+        return HttpPaymentGateway(PAYMENT_GATEWAY_URL, PAYMENT_GATEWAY_KEY)
+    return FakePaymentGateway()
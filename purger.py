@@ -0,0 +1,84 @@
+import time
+from functools import partial
+from typing import Callable
+from sqlalchemy import delete, exists, select, text, update, or_
+from database import SessionLocal
+from models import Category, Course, Lesson, Exam, Question, Certificate, CourseSimilarity, ExamAttempt, \
+LeaderboardSnapshot, Enrollment, Order
+from config import PURGE_BATCH_SIZE, PURGE_LOCK_TIMEOUT_MS
+
+
+# Rows that reference a course, deleted child-first before the course itself.
+COURSE_DEPENDENTS = [
+    (Question, lambda course_id: Question.exam_id.in_(select(Exam.id).where(Exam.course_id == course_id))),
+    (ExamAttempt, lambda course_id: ExamAttempt.exam_id.in_(select(Exam.id).where(Exam.course_id == course_id))),
+    (LeaderboardSnapshot,
+     lambda course_id: LeaderboardSnapshot.exam_id.in_(select(Exam.id).where(Exam.course_id == course_id))),
+    (Exam, lambda course_id: Exam.course_id == course_id),
+    (Lesson, lambda course_id: Lesson.course_id == course_id),
+    (Certificate, lambda course_id: Certificate.course_id == course_id),
+    (Enrollment, lambda course_id: Enrollment.course_id == course_id),
+    (CourseSimilarity, lambda course_id: or_(CourseSimilarity.course_id == course_id,
+                                             CourseSimilarity.similar_course_id == course_id)),
+]
+
+
+def in_batch(model, condition, batch_size: int):
+    return model.id.in_(select(model.id).where(condition).limit(batch_size)
+                        .with_for_update(skip_locked=True).scalar_subquery())
+
+
+def run_batch(statement) -> int:
+    # One short transaction per batch keeps row locks held for a bounded time;
+    # SKIP LOCKED leaves rows that a request is still touching for the next pass.
+    with SessionLocal() as db:
+        db.execute(text(f"SET LOCAL lock_timeout = {int(PURGE_LOCK_TIMEOUT_MS)}"))
+        count = db.execute(statement).rowcount
+        db.commit()
+    return count
+
+
+def delete_batch(model, condition, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    return run_batch(delete(model).where(in_batch(model, condition, batch_size)))
+
+
+def detach_batch(category_ids, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    condition = Course.category_id.in_(category_ids)
+    return run_batch(update(Course).where(in_batch(Course, condition, batch_size))
+                     .values(category_id=None, version=Course.version + 1))
+
+
+def drain(batch: Callable[[], int], batch_size: int = PURGE_BATCH_SIZE, pause: float = 0.01) -> int:
+    total = 0
+    while True:
+        done = batch()
+        total += done
+        if done < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def purge_course(course_id: int, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    total = 0
+    for model, condition in COURSE_DEPENDENTS:
+        total += drain(partial(delete_batch, model, condition(course_id), batch_size), batch_size)
+    total += delete_batch(Course, (Course.id == course_id) & Course.deleted_at.is_not(None), 1)
+    return total
+
+
+def purge_deleted(batch_size: int = PURGE_BATCH_SIZE) -> int:
+    # Courses that were ever ordered stay soft-deleted so order history keeps its course.
+    ordered = exists(select(Order.id).where(Order.course_id == Course.id))
+    with SessionLocal() as db:
+        course_ids = db.scalars(select(Course.id).where(Course.deleted_at.is_not(None), ~ordered)
+                                .order_by(Course.deleted_at).limit(batch_size)).all()
+    total = 0
+    for course_id in course_ids:
+        total += purge_course(course_id, batch_size)
+    deleted_categories = select(Category.id).where(Category.deleted_at.is_not(None))
+    drain(partial(detach_batch, deleted_categories, batch_size), batch_size)
+    # A course that was locked during the detach still points at its category until the next pass.
+    unused = ~exists(select(Course.id).where(Course.category_id == Category.id))
+    total += drain(partial(delete_batch, Category, Category.deleted_at.is_not(None) & unused, batch_size),
+                   batch_size)
+    return total
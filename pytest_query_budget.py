@@ -0,0 +1,262 @@
+"""Checks that every route in main.py declares a @query_budget and stays
+within it.
+
+    QUERY_BUDGET_DATABASE_URL=postgresql://.../course_test pytest --query-budgets
+
+The tables are created in QUERY_BUDGET_DATABASE_URL, seeded with one row of
+each kind and dropped again at the end. DATABASE_URL is never used, so a
+stray run cannot wipe the development database. GET routes run first, then
+the write routes with the bodies in REQUESTS; DELETE routes remove
+rows seeded only for them.
+"""
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+from decimal import Decimal
+from fastapi.routing import APIRoute
+
+
+# Never finish, so there is nothing to count at the end of the request.
+STREAMING_PATHS = {'/events/{topic}'}
+# Writes run after every GET, and PATCH before PUT so the seeded version still matches.
+METHOD_ORDER = ('GET', 'POST', 'PATCH', 'PUT', 'DELETE')
+NOW = '2026-01-01T00:00:00'
+
+
+def course_body(p, course_id=0):
+    return {'id': course_id, 'course_name': 'Query budget', 'description': '-', 'level': 'легкий', 'price': 10,
+            'type_course': 'платный', 'created_at': NOW, 'updated_at': NOW, 'author_id': p['student_id'],
+            'category_id': p['category_id']}
+
+
+def webhook_request(p):
+    from config import PAYMENT_WEBHOOK_SECRET
+    body = json.dumps({'reference': p['reference'], 'status': 'succeeded'}).encode()
+    signature = hmac.new(PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return {'content': body, 'headers': {'x-signature': signature}}
+
+
+# Keyword arguments for TestClient.request, built from the seeded ids.
+REQUESTS = {
+    ('GET', '/audit/'): lambda p: {'headers': {'authorization': f"Bearer {p['token']}"}},
+    ('POST', '/register/'): lambda p: {'json': {'id': 0, 'first_name': 'New', 'last_name': 'User',
+                                                'username': 'query-budget-new', 'password': 'secret',
+                                                'role': 'student'}},
+    ('POST', '/login'): lambda p: {'data': {'username': p['teacher'], 'password': p['password']}},
+    ('POST', '/logout'): lambda p: {'params': {'refresh_token': p['refresh_token']}},
+    ('POST', '/category/create/'): lambda p: {'json': {'id': 0, 'category_name': 'query-budget-new'}},
+    ('PUT', '/category/{category_id}/'): lambda p: {'json': {'id': p['category_id'],
+                                                             'category_name': 'query-budget-renamed'}},
+    ('POST', '/course/create/'): lambda p: {'json': course_body(p)},
+    ('PUT', '/course_update/{course_id}/'): lambda p: {'json': course_body(p, p['course_id'])},
+    ('PATCH', '/course/{course_id}/'): lambda p: {'json': {'version': 1, 'description': 'patched'}},
+    ('POST', '/lesson_post/'): lambda p: {'json': {'id': 0, 'title': 'New', 'course_id': p['course_id']}},
+    ('PUT', '/lesson/{lesson_id}/'): lambda p: {'json': {'id': p['lesson_id'], 'title': 'Renamed',
+                                                         'course_id': p['course_id']}},
+    ('PATCH', '/lesson/{lesson_id}/'): lambda p: {'json': {'version': 1, 'title': 'Patched'}},
+    ('POST', '/exam_post/'): lambda p: {'json': {'id': 0, 'title': 'New', 'course_id': p['course_id'],
+                                                 'end_time': 600}},
+    ('PUT', '/exam/{exam_id}/'): lambda p: {'json': {'id': p['exam_id'], 'title': 'Renamed',
+                                                     'course_id': p['course_id'], 'end_time': 600}},
+    ('POST', '/question/create/'): lambda p: {'json': {'id': 0, 'exam_id': p['exam_id'], 'title': 'New',
+                                                       'score': 1}},
+    ('PUT', '/question/{question_id}/'): lambda p: {'json': {'id': p['question_id'], 'exam_id': p['exam_id'],
+                                                             'title': 'Renamed', 'score': 5}},
+    ('PATCH', '/question/{question_id}/'): lambda p: {'json': {'version': 1, 'title': 'Patched'}},
+    ('POST', '/certificate/create/'): lambda p: {'json': {'id': 0, 'student_id': p['student_id'],
+                                                          'course_id': p['course_id'], 'issued_at': NOW,
+                                                          'certificate_url': '/new'}},
+    ('PUT', '/certificate/{certificate_id}/'): lambda p: {'json': {'id': p['certificate_id'],
+                                                                   'student_id': p['student_id'],
+                                                                   'course_id': p['course_id'], 'issued_at': NOW,
+                                                                   'certificate_url': '/renamed'}},
+    ('PATCH', '/certificate/{certificate_id}/'): lambda p: {'json': {'version': 1, 'certificate_url': '/patched'}},
+    ('PUT', '/lesson/{lesson_id}/video/'): lambda p: {'content': b'video', 'headers': {'content-type': 'video/mp4'}},
+    ('PUT', '/lesson/{lesson_id}/content/'): lambda p: {'content': b'text',
+                                                        'headers': {'content-type': 'text/plain'}},
+    ('PUT', '/user/{user_id}/picture/'): lambda p: {'content': b'image', 'headers': {'content-type': 'image/png'}},
+    ('POST', '/exam/{exam_id}/submit/'): lambda p: {'json': {'student_id': p['student_id'],
+                                                             'correct_question_ids': [p['question_id']]},
+                                                    'headers': {'authorization': f"Bearer {p['token']}"}},
+    # The teacher has no order yet, so this creates one.
+    ('POST', '/course/{course_id}/checkout/'): lambda p: {'json': {'student_id': p['teacher_id']}},
+    ('POST', '/payments/webhook/'): webhook_request,
+}
+
+
+def pytest_addoption(parser):
+    parser.addoption('--query-budgets', action='store_true',
+                     help='check that every route has a query budget and request every GET route against '
+                          'a seeded QUERY_BUDGET_DATABASE_URL')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'query_budget: per-route query budget check')
+    if not config.getoption('--query-budgets'):
+        return
+    url = os.getenv('QUERY_BUDGET_DATABASE_URL')
+    if not url:
+        raise pytest.UsageError('--query-budgets creates and drops every table; '
+                                'set QUERY_BUDGET_DATABASE_URL to a throwaway database')
+    if 'config' in sys.modules:
+        raise pytest.UsageError('config was imported before the query budget plugin could point it at '
+                                'QUERY_BUDGET_DATABASE_URL')
+    # load_dotenv() does not override variables that are already set.
+    os.environ['DATABASE_URL'] = url
+    os.environ['MEDIA_ROOT'] = tempfile.mkdtemp(prefix='query-budget-media-')
+    os.environ.setdefault('PAYMENT_WEBHOOK_SECRET', 'query-budget')
+
+
+def get_routes():
+    from main import course_app
+    routes = [(method, route) for route in course_app.routes if isinstance(route, APIRoute)
+              for method in sorted(route.methods) if method != 'HEAD']
+    return sorted(routes, key=lambda item: METHOD_ORDER.index(item[0]))
+
+
+def seed_children(db, course_id, student_id, exam_id=None):
+    from models import Lesson, Exam, Question, Certificate
+    lesson = Lesson(title='Lesson', course_id=course_id)
+    exam = Exam(title='Exam', course_id=course_id, end_time=600)
+    certificate = Certificate(student_id=student_id, course_id=course_id, certificate_url='/certificate')
+    db.add_all([lesson, exam, certificate])
+    db.flush()
+    question = Question(exam_id=exam_id or exam.id, title='Question', score=5)
+    db.add(question)
+    db.flush()
+    return {'lesson_id': lesson.id, 'exam_id': exam.id, 'question_id': question.id,
+            'certificate_id': certificate.id}
+
+
+def seed():
+    """Returns the ids for the path and body templates, and the ids DELETE routes may remove."""
+    from database import SessionLocal
+    from models import Tenant, UserProfile, Category, Course, Certificate, Order, Payment, RefreshToken, UserRole, \
+        StatusCourse, TypeCourse
+    from tenancy import current_tenant
+    from main import leaderboards, certificate_index, create_access_token, get_password_hash
+    from certificates import code_hash
+
+    password = 'query-budget'
+    with SessionLocal() as db:
+        tenant = Tenant(name='query-budget', host='testserver')
+        db.add(tenant)
+        db.flush()
+        current_tenant.set(tenant.id)
+        student = UserProfile(first_name='Query', last_name='Budget', username='query-budget', password='-',
+                              role=UserRole.student)
+        teacher = UserProfile(first_name='Query', last_name='Teacher', username='query-budget-teacher',
+                              password=get_password_hash(password), role=UserRole.teacher)
+        category, doomed_category = Category(category_name='query-budget'), Category(category_name='doomed')
+        course, doomed_course = [Course(course_name='Query budget', description='Seeded by pytest_query_budget',
+                                        level=StatusCourse.level1, price=Decimal('10.00'),
+                                        type_course=TypeCourse.type2, author=student, category=category)
+                                 for _ in range(2)]
+        db.add_all([student, teacher, category, doomed_category, course, doomed_course])
+        db.flush()
+        params = {'category_id': category.id, 'course_id': course.id,
+                  **seed_children(db, course.id, student.id)}
+        # Children of the live course and exam, so deleting their doomed parents does not hide them.
+        doomed = {'category_id': doomed_category.id, 'course_id': doomed_course.id,
+                  **seed_children(db, course.id, student.id, params['exam_id'])}
+        order = Order(student_id=student.id, course_id=course.id, amount=course.price)
+        db.add_all([order, Payment(order=order, provider_reference='query-budget'),
+                    RefreshToken(token='query-budget', user_id=teacher.id)])
+        db.commit()
+        certificate = db.get(Certificate, params['certificate_id'])
+        leaderboards.apply(params['exam_id'], params['course_id'], student.id, 5)
+        certificate_index.add(certificate.id, code_hash(certificate.verification_code))
+        params.update(order_id=order.id, student_id=student.id, user_id=student.id, teacher_id=teacher.id,
+                      teacher=teacher.username, password=password, refresh_token='query-budget',
+                      reference='query-budget', kind='exam', board_id=params['exam_id'],
+                      key='query-budget/missing', code=certificate.verification_code,
+                      token=create_access_token({'sub': teacher.username, 'tenant': tenant.id}))
+        return params, {**params, **doomed}
+
+
+class QueryBudgetFixture:
+    def __init__(self):
+        self.client = None
+        self.params = None
+        self.doomed = None
+
+    def start(self):
+        from fastapi.testclient import TestClient
+        from database import Base, engine
+        from main import course_app
+        Base.metadata.create_all(engine)
+        self.params, self.doomed = seed()
+        # Background tasks (thumbnails, posters) may fail on the dummy uploads after the response is counted.
+        self.client = TestClient(course_app, raise_server_exceptions=False)
+        # The first request pays for connecting and dialect setup; keep that out of the counts.
+        self.client.get('/health/live')
+        self.client.get('/category/')
+
+    def stop(self):
+        if self.client is not None:
+            from database import Base, engine
+            self.client.close()
+            Base.metadata.drop_all(engine)
+            shutil.rmtree(os.environ['MEDIA_ROOT'], ignore_errors=True)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudgetItem(pytest.Item):
+    def __init__(self, *, method: str, route: APIRoute, fixture: QueryBudgetFixture, **kwargs):
+        super().__init__(**kwargs)
+        self.method = method
+        self.route = route
+        self.fixture = fixture
+        self.add_marker('query_budget')
+
+    def runtest(self):
+        from query_budget import budget_for, QUERY_COUNT_HEADER
+        budget = budget_for(self.route.endpoint)
+        if budget is None:
+            raise QueryBudgetExceeded(f'{self.method} {self.route.path} has no @query_budget')
+        if self.route.path in STREAMING_PATHS:
+            return
+        if self.fixture.client is None:
+            self.fixture.start()
+        params = self.fixture.doomed if self.method == 'DELETE' else self.fixture.params
+        build = REQUESTS.get((self.method, self.route.path), lambda p: {})
+        response = self.fixture.client.request(self.method, self.route.path_format.format(**params), **build(params))
+        if response.status_code == 500:
+            raise QueryBudgetExceeded(f'{self.method} {self.route.path} failed with {response.status_code}: '
+                                      f'{response.text[:200]}')
+        count = int(response.headers[QUERY_COUNT_HEADER])
+        if count > budget:
+            raise QueryBudgetExceeded(f'{self.method} {self.route.path} ran {count} queries, budget is {budget} '
+                                      f'(status {response.status_code})')
+
+    def repr_failure(self, excinfo):
+        if isinstance(excinfo.value, QueryBudgetExceeded):
+            return str(excinfo.value)
+        return super().repr_failure(excinfo)
+
+    def reportinfo(self):
+        return self.path, None, f'query budget: {self.method} {self.route.path}'
+
+
+def pytest_collection_modifyitems(session, config, items):
+    if not config.getoption('--query-budgets'):
+        return
+    fixture = QueryBudgetFixture()
+    config._query_budget_fixture = fixture
+    for method, route in get_routes():
+        items.append(QueryBudgetItem.from_parent(session, name=f'query_budget[{method} {route.path}]',
+                                                 method=method, route=route, fixture=fixture))
+
+
+def pytest_sessionfinish(session):
+    fixture = getattr(session.config, '_query_budget_fixture', None)
+    if fixture is not None:
+        fixture.stop()
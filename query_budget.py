@@ -0,0 +1,71 @@
+import logging
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from config import QUERY_BUDGET_MODE
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+
+query_counter: ContextVar[Optional[list[int]]] = ContextVar("query_counter", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def query_budget(limit: int):
+    """Declare the most SQL statements one request to this endpoint may run.
+
+    Put it under the route decorator:
+
+        @course_app.get('/course/')
+        @query_budget(1)
+        async def course_get(...):
+    """
+    def decorate(endpoint):
+        endpoint.__query_budget__ = limit
+        return endpoint
+    return decorate
+
+
+def budget_for(endpoint) -> Optional[int]:
+    return getattr(endpoint, "__query_budget__", None)
+
+
+class QueryBudgetMiddleware(BaseHTTPMiddleware):
+    """Counts statements per request and reports routes that go over budget.
+
+    In "log" mode an overrun is logged; in "raise" mode the response is
+    replaced with a 500 so the regression cannot go unnoticed in staging.
+    """
+
+    def __init__(self, app, mode: str = QUERY_BUDGET_MODE):
+        super().__init__(app)
+        self.mode = mode
+
+    async def dispatch(self, request, call_next):
+        counter = [0]
+        token = query_counter.set(counter)
+        try:
+            response = await call_next(request)
+        finally:
+            query_counter.reset(token)
+        count = counter[0]
+        response.headers[QUERY_COUNT_HEADER] = str(count)
+
+        budget = budget_for(request.scope.get("endpoint"))
+        if budget is not None and count > budget:
+            logger.warning("%s %s ran %d queries, budget is %d", request.method, request.url.path, count, budget)
+            if self.mode == "raise":
+                return JSONResponse(status_code=500, headers={QUERY_COUNT_HEADER: str(count)},
+                                    content={"detail": f"Query budget exceeded: {count} > {budget}"})
+        return response
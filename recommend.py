@@ -0,0 +1,233 @@
+import re
+import threading
+from hashlib import blake2b
+from typing import Callable, Optional
+import numpy as np
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.orm import joinedload
+from database import SessionLocal
+from models import Course, CourseSimilarity
+from config import RECOMMEND_TOP_K, RECOMMEND_FEATURE_DIM, RECOMMEND_BLOCK_SIZE, RECOMMEND_LOCK_KEY
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+Neighbors = list[tuple[int, float]]
+
+
+def course_features(course: Course) -> list[str]:
+    features = TOKEN_RE.findall(course.course_name.lower()) * 2 + TOKEN_RE.findall(course.description.lower())
+    features += [f"level:{course.level.name}", f"type:{course.type_course.name}"]
+    if course.category is not None:
+        features += [f"category:{course.category.category_name.lower()}"] * 2
+    return features
+
+
+def feature_counts(features: list[str], dim: int = RECOMMEND_FEATURE_DIM) -> np.ndarray:
+    counts = np.zeros(dim, dtype=np.float32)
+    indexes = [int.from_bytes(blake2b(feature.encode(), digest_size=8).digest(), "little") % dim
+               for feature in features]
+    np.add.at(counts, indexes, 1)
+    return counts
+
+
+class Recommender:
+    """Hashed TF-IDF vectors of live courses and their top-k cosine neighbours.
+
+    `neighbors` is what the API serves. The full all-pairs build only runs
+    offline (`python recommend.py`). The vectors are only needed to refresh
+    neighbours incrementally and are loaded on first use in the worker that
+    needs them. Every refresh and removal is passed to `notify` with the new
+    feature counts and neighbour lists, and `apply` replays it in the other
+    workers, so none of them refreshes from, or saves, a stale copy.
+    """
+
+    def __init__(self, top_k: int = RECOMMEND_TOP_K, dim: int = RECOMMEND_FEATURE_DIM,
+                 block_size: int = RECOMMEND_BLOCK_SIZE, notify: Optional[Callable[[str, dict], None]] = None):
+        self.top_k = top_k
+        self.dim = dim
+        self.block_size = block_size
+        self.notify = notify or (lambda event, data: None)
+        self.lock = threading.Lock()
+        self.neighbors: dict[int, Neighbors] = {}
+        self.ids: list[int] = []
+        self.rows: dict[int, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self.df = np.zeros(dim, dtype=np.float32)
+        # Tenant of each row; courses are only ever neighbours within one school.
+        self.tenants = np.zeros(0, dtype=np.int64)
+
+    def similar(self, course_id: int) -> Neighbors:
+        return self.neighbors.get(course_id, [])
+
+    def weigh(self, counts: np.ndarray) -> np.ndarray:
+        idf = np.log((1 + len(self.ids)) / (1 + self.df)) + 1
+        weighted = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0) * idf
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return (weighted / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def top_k_all(self) -> dict[int, Neighbors]:
+        count = len(self.ids)
+        k = min(self.top_k, count - 1)
+        if k <= 0:
+            return {course_id: [] for course_id in self.ids}
+        neighbors = {}
+        for start in range(0, count, self.block_size):
+            rows = np.arange(start, min(start + self.block_size, count))
+            scores = self.vectors[rows] @ self.vectors.T
+            scores[rows - start, rows] = -np.inf
+            scores[self.tenants[rows][:, None] != self.tenants[None, :]] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+            for i, row in enumerate(rows):
+                neighbors[self.ids[row]] = [(self.ids[j], float(score))
+                                            for j, score in zip(top[i], top_scores[i]) if score > 0]
+        return neighbors
+
+    def build(self):
+        self.load_vectors()
+        with self.lock:
+            self.neighbors = self.top_k_all()
+        self.save(self.neighbors, replace_all=True)
+
+    def load_vectors(self):
+        with SessionLocal() as db:
+            courses = db.scalars(select(Course).options(joinedload(Course.category))
+                                 .where(Course.deleted_at.is_(None)).order_by(Course.id)
+                                 .execution_options(all_tenants=True)).all()
+            counts = np.stack([feature_counts(course_features(course), self.dim) for course in courses]) \
+                if courses else np.zeros((0, self.dim), dtype=np.float32)
+        with self.lock:
+            self.ids = [course.id for course in courses]
+            self.rows = {course_id: row for row, course_id in enumerate(self.ids)}
+            self.tenants = np.array([course.tenant_id for course in courses], dtype=np.int64)
+            self.df = (counts > 0).sum(axis=0).astype(np.float32)
+            self.vectors = self.weigh(counts)
+
+    def refresh_course(self, course_id: int):
+        if self.vectors is None:
+            self.load_vectors()
+        with SessionLocal() as db:
+            course = db.scalars(select(Course).options(joinedload(Course.category))
+                                .where(Course.id == course_id, Course.deleted_at.is_(None))
+                                .execution_options(all_tenants=True)).first()
+            if course is None:
+                return self.remove_course(course_id)
+            counts = feature_counts(course_features(course), self.dim)
+            tenant_id = course.tenant_id
+
+        with self.lock:
+            row = self.set_vector(course_id, counts, tenant_id)
+            scores = self.vectors @ self.vectors[row]
+            scores[self.tenants != tenant_id] = -np.inf
+            scores[row] = -np.inf
+            k = min(self.top_k, len(self.ids) - 1)
+            top = np.argsort(-scores)[:k] if k > 0 else []
+            self.neighbors[course_id] = [(self.ids[j], float(scores[j])) for j in top if scores[j] > 0]
+
+            changed = {course_id}
+            for other, score in zip(self.ids, scores.tolist()):
+                current = self.neighbors.get(other, [])
+                kept = [item for item in current if item[0] != course_id]
+                if other != course_id and score > 0 and (len(kept) < self.top_k or score > kept[-1][1]):
+                    kept = sorted(kept + [(course_id, score)], key=lambda item: -item[1])[:self.top_k]
+                if kept != current:
+                    self.neighbors[other] = kept
+                    changed.add(other)
+            updated = {other: self.neighbors[other] for other in changed}
+        self.save(updated)
+        nonzero = np.flatnonzero(counts)
+        self.notify("course.refreshed", {"course_id": course_id, "tenant_id": tenant_id,
+                                         "counts": dict(zip(nonzero.tolist(), counts[nonzero].tolist())),
+                                         "neighbors": updated})
+
+    def set_vector(self, course_id: int, counts: np.ndarray, tenant_id: int) -> int:
+        # Callers hold self.lock.
+        row = self.rows.get(course_id)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(course_id)
+            self.rows[course_id] = row
+            self.vectors = np.vstack([self.vectors, np.zeros((1, self.dim), dtype=np.float32)])
+            self.tenants = np.append(self.tenants, tenant_id)
+        else:
+            self.df -= self.vectors[row] > 0
+        self.df += counts > 0
+        self.vectors[row] = self.weigh(counts)
+        return row
+
+    def drop_vector(self, course_id: int):
+        # Callers hold self.lock.
+        row = self.rows.pop(course_id, None)
+        if row is not None and self.vectors is not None:
+            self.df -= self.vectors[row] > 0
+            self.vectors = np.delete(self.vectors, row, axis=0)
+            self.tenants = np.delete(self.tenants, row)
+            del self.ids[row]
+            self.rows = {other: index for index, other in enumerate(self.ids)}
+
+    def apply(self, event: dict):
+        """Replay a refresh or removal published by any worker, this one included.
+
+        Only memory is touched; a worker that has not loaded its vectors yet
+        reads the current courses when it does."""
+        data = event["data"]
+        course_id = data["course_id"]
+        with self.lock:
+            if event["event"] == "course.removed":
+                self.drop_vector(course_id)
+                self.neighbors.pop(course_id, None)
+            elif self.vectors is not None:
+                counts = np.zeros(self.dim, dtype=np.float32)
+                for index, count in data["counts"].items():
+                    counts[int(index)] = count
+                self.set_vector(course_id, counts, data["tenant_id"])
+            for other, items in data["neighbors"].items():
+                self.neighbors[int(other)] = [(similar_id, score) for similar_id, score in items]
+
+    def remove_course(self, course_id: int):
+        with self.lock:
+            self.drop_vector(course_id)
+            self.neighbors.pop(course_id, None)
+            updated = {}
+            for other, current in self.neighbors.items():
+                kept = [item for item in current if item[0] != course_id]
+                if kept != current:
+                    self.neighbors[other] = updated[other] = kept
+        with SessionLocal() as db:
+            db.execute(delete(CourseSimilarity).where(or_(CourseSimilarity.course_id == course_id,
+                                                          CourseSimilarity.similar_course_id == course_id)))
+            db.commit()
+        self.save(updated)
+        self.notify("course.removed", {"course_id": course_id, "neighbors": updated})
+
+    def save(self, neighbors: dict[int, Neighbors], replace_all: bool = False):
+        rows = [{"course_id": course_id, "similar_course_id": similar_id, "rank": rank, "score": score}
+                for course_id, items in neighbors.items() for rank, (similar_id, score) in enumerate(items)]
+        with SessionLocal() as db:
+            # Workers saving at the same time would interleave their deletes and inserts.
+            db.execute(select(func.pg_advisory_xact_lock(RECOMMEND_LOCK_KEY)))
+            if replace_all:
+                db.execute(delete(CourseSimilarity))
+            elif neighbors:
+                db.execute(delete(CourseSimilarity).where(CourseSimilarity.course_id.in_(list(neighbors))))
+            if rows:
+                db.execute(insert(CourseSimilarity), rows)
+            db.commit()
+
+    def load_neighbors(self):
+        neighbors: dict[int, Neighbors] = {}
+        with SessionLocal() as db:
+            result = db.execute(select(CourseSimilarity.course_id, CourseSimilarity.similar_course_id,
+                                       CourseSimilarity.score)
+                                .order_by(CourseSimilarity.course_id, CourseSimilarity.rank))
+            for course_id, similar_id, score in result:
+                neighbors.setdefault(course_id, []).append((similar_id, score))
+        with self.lock:
+            self.neighbors = neighbors
+
+
+if __name__ == '__main__':
+    Recommender().build()
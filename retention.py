@@ -0,0 +1,138 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+from sqlalchemy import delete, func, select
+from database import SessionLocal
+from models import RefreshToken, Certificate, ExamAttempt, OutboxEvent
+from audit import plain
+from config import RETENTION_DAYS, RETENTION_BATCH_SIZE, RETENTION_ARCHIVE_DIR, RETENTION_DRY_RUN
+
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy(NamedTuple):
+    name: str
+    model: Any
+    # Rows whose timestamp is older than `days` are archived and deleted.
+    column: Any
+    days: Optional[int]
+
+
+POLICIES = [
+    RetentionPolicy("refresh_token", RefreshToken, RefreshToken.created_date, RETENTION_DAYS["refresh_token"]),
+    # Best scores live on in leaderboard_snapshots, so old attempts can go.
+    RetentionPolicy("exam_attempts", ExamAttempt, ExamAttempt.submitted_at, RETENTION_DAYS["exam_attempts"]),
+    RetentionPolicy("outbox_events", OutboxEvent, OutboxEvent.processed_at, RETENTION_DAYS["outbox_events"]),
+    RetentionPolicy("certificates", Certificate, Certificate.issued_at, RETENTION_DAYS["certificates"]),
+]
+
+
+class RetentionScheduler:
+    """Moves rows past their retention period to gzipped NDJSON files and
+    deletes them in short transactions.
+
+    Each batch is locked with SKIP LOCKED, written and fsynced to the archive,
+    then deleted in the same transaction, so workers running this at the same
+    time never archive the same rows. A row can be archived twice only if the
+    delete fails after the write.
+    """
+
+    def __init__(self, policies: list[RetentionPolicy] = POLICIES, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                 batch_size: int = RETENTION_BATCH_SIZE, dry_run: bool = RETENTION_DRY_RUN):
+        self.policies = {policy.name: policy for policy in policies}
+        self.archive_dir = Path(archive_dir)
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stats: dict[str, dict] = {}
+
+    def enforce(self, names: Optional[list[str]] = None) -> int:
+        total = 0
+        for name in names or self.policies:
+            policy = self.policies[name]
+            if policy.days is None:
+                continue
+            try:
+                total += self.run_policy(policy)
+            except Exception:
+                logger.exception("Retention policy %s failed", name)
+        return total
+
+    def run_policy(self, policy: RetentionPolicy) -> int:
+        condition = policy.column < datetime.utcnow() - timedelta(days=policy.days)
+        started = time.perf_counter()
+        archive = None
+        if self.dry_run:
+            with SessionLocal() as db:
+                rows = db.scalar(select(func.count()).select_from(policy.model).where(condition))
+        else:
+            rows, archive = self.archive_and_delete(policy, condition)
+        elapsed = time.perf_counter() - started
+
+        stats = self.stats.setdefault(policy.name, {"rows_moved": 0, "seconds": 0.0})
+        stats.update(last_run_at=datetime.utcnow().isoformat(), last_dry_run=self.dry_run, last_rows=rows,
+                     last_seconds=round(elapsed, 3), last_archive=str(archive) if archive else None)
+        if not self.dry_run:
+            stats["rows_moved"] += rows
+            stats["seconds"] = round(stats["seconds"] + elapsed, 3)
+        if rows:
+            logger.info("Retention %s: %s %d rows in %.2fs", policy.name,
+                        "would move" if self.dry_run else "moved", rows, elapsed)
+        return rows
+
+    def archive_and_delete(self, policy: RetentionPolicy, condition, pause: float = 0.01):
+        table = policy.model.__table__
+        path = self.archive_dir / policy.name / f"{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}.ndjson.gz"
+        archive = None
+        moved = 0
+        try:
+            while True:
+                with SessionLocal() as db:
+                    rows = db.execute(select(table).where(condition).order_by(table.c.id)
+                                      .limit(self.batch_size).with_for_update(skip_locked=True)).mappings().all()
+                    if not rows:
+                        break
+                    if archive is None:
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        archive = gzip.open(path, "wt", encoding="utf-8")
+                    for row in rows:
+                        archive.write(json.dumps({key: plain(value) for key, value in row.items()},
+                                                 ensure_ascii=False) + "\n")
+                    # The rows must be on disk before the delete commits.
+                    archive.flush()
+                    os.fsync(archive.fileno())
+                    db.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+                    db.commit()
+                moved += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+                time.sleep(pause)
+        finally:
+            if archive is not None:
+                archive.close()
+        return moved, path if archive is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and delete rows past their retention period.")
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be moved")
+    parser.add_argument("--policy", action="append", choices=[policy.name for policy in POLICIES],
+                        help="run only this policy; may be repeated")
+    args = parser.parse_args()
+    scheduler = RetentionScheduler(dry_run=args.dry_run or RETENTION_DRY_RUN)
+    for name in args.policy or []:
+        if scheduler.policies[name].days is None:
+            parser.error(f"policy {name} is disabled in RETENTION_DAYS")
+    scheduler.enforce(args.policy)
+    print(json.dumps(scheduler.stats, indent=2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
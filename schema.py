@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
-from models import UserRole, StatusCourse, TypeCourse
+from models import UserRole, StatusCourse, TypeCourse, OrderStatus, PaymentStatus
 
 
 class UserLogin(BaseModel):
@@ -41,7 +41,8 @@ class CourseSchema(BaseModel):
     created_at: datetime
     updated_at: datetime
     author_id: int
-
+    category_id: Optional[int] = None
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -53,7 +54,7 @@ class LessonSchema(BaseModel):
     video_url: Optional[str] = None
     content: Optional[str] = None
     course_id: int
-
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -74,7 +75,7 @@ class QuestionSchema(BaseModel):
     exam_id: int
     title: str
     score: int
-
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -86,6 +87,114 @@ class CertificateSchema(BaseModel):
     course_id: int
     issued_at: datetime
     certificate_url: str
+    version: int = 1
+
+    class Config:
+        from_attributes = True
+
+
+# Only the response to create carries the code; anyone who can list certificates must not see it.
+class IssuedCertificateSchema(CertificateSchema):
+    verification_code: str
+
+
+class CoursePatchSchema(BaseModel):
+    version: int
+    course_name: Optional[str] = None
+    description: Optional[str] = None
+    level: Optional[StatusCourse] = None
+    price: Optional[float] = None
+    type_course: Optional[TypeCourse] = None
+    author_id: Optional[int] = None
+    category_id: Optional[int] = None
+
+
+class LessonPatchSchema(BaseModel):
+    version: int
+    title: Optional[str] = None
+    video_url: Optional[str] = None
+    content: Optional[str] = None
+    course_id: Optional[int] = None
+
+
+class QuestionPatchSchema(BaseModel):
+    version: int
+    exam_id: Optional[int] = None
+    title: Optional[str] = None
+    score: Optional[int] = None
+
+
+class CertificatePatchSchema(BaseModel):
+    version: int
+    student_id: Optional[int] = None
+    course_id: Optional[int] = None
+    certificate_url: Optional[str] = None
+
+
+class ExamSubmissionSchema(BaseModel):
+    student_id: int
+    correct_question_ids: List[int]
+
+
+class ExamAttemptSchema(BaseModel):
+    id: int
+    exam_id: int
+    student_id: int
+    score: int
+    submitted_at: datetime
+    rank: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LeaderboardEntrySchema(BaseModel):
+    rank: int
+    student_id: int
+    score: int
+
+
+class CheckoutSchema(BaseModel):
+    student_id: int
+
+
+class OrderSchema(BaseModel):
+    id: int
+    student_id: int
+    course_id: int
+    amount: float
+    status: OrderStatus
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class PaymentWebhookSchema(BaseModel):
+    reference: str
+    status: PaymentStatus
+
+
+class SimilarCourseSchema(BaseModel):
+    course_id: int
+    score: float
+
+
+class AuditEventSchema(BaseModel):
+    id: int
+    occurred_at: datetime
+    tenant_id: Optional[int]
+    actor: Optional[str]
+    source: str
+    action: str
+    entity: str
+    entity_id: int
+    changes: Optional[dict]
 
     class Config:
         from_attributes = True
+
+
+class AuditPageSchema(BaseModel):
+    events: List[AuditEventSchema]
+    next_cursor: Optional[str]
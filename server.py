@@ -0,0 +1,48 @@
+import logging
+import os
+import uvicorn
+from config import SERVER_HOST, SERVER_PORT, WEB_CONCURRENCY, GRACEFUL_SHUTDOWN_SECONDS, DB_POOL_SIZE, \
+DB_MAX_OVERFLOW, DB_MAX_CONNECTIONS, EVENT_BROKER_URL
+
+logger = logging.getLogger(__name__)
+
+# Connections kept free for migrations, the offline jobs and psql sessions.
+RESERVED_DB_CONNECTIONS = 10
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    # Leaderboards, the certificate index and SSE subscribers live in each worker
+    # and only stay in step through the event broker.
+    if WEB_CONCURRENCY:
+        if int(WEB_CONCURRENCY) > 1 and not EVENT_BROKER_URL:
+            raise SystemExit("WEB_CONCURRENCY > 1 needs EVENT_BROKER_URL; without a broker workers drift apart")
+        return int(WEB_CONCURRENCY)
+    if not EVENT_BROKER_URL:
+        logger.error("EVENT_BROKER_URL is not set, starting a single worker")
+        return 1
+    # Every worker owns a pool of up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections,
+    # so the database's connection limit caps the worker count as well as the CPUs.
+    by_database = (DB_MAX_CONNECTIONS - RESERVED_DB_CONNECTIONS) // (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    return max(1, min(available_cpus(), by_database))
+
+
+def main():
+    uvicorn.run(
+        "main:course_app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=worker_count(),
+        lifespan="on",
+        proxy_headers=True,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+    )
+
+
+if __name__ == '__main__':
+    main()
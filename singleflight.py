@@ -0,0 +1,57 @@
+import asyncio
+from time import monotonic
+from typing import Any, Hashable
+from starlette.concurrency import run_in_threadpool
+
+
+class SingleFlight:
+    """Runs one loader per key at a time; concurrent callers share its result.
+
+    With `cache_ttl` > 0 the result is also kept for that many seconds, so
+    requests that arrive right after the load finishes skip the database too.
+    """
+
+    def __init__(self, cache_ttl: float = 0.0, max_cached: int = 10000):
+        self.cache_ttl = cache_ttl
+        self.max_cached = max_cached
+        self.in_flight: dict[Hashable, asyncio.Task] = {}
+        self.cache: dict[Hashable, tuple[float, Any]] = {}
+        self.stats = {"requests": 0, "executions": 0, "coalesced": 0, "cache_hits": 0}
+
+    async def do(self, key: Hashable, func, *args):
+        self.stats["requests"] += 1
+        if self.cache_ttl:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] > monotonic():
+                self.stats["cache_hits"] += 1
+                return cached[1]
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(self._run(key, func, *args))
+            self.in_flight[key] = task
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, func, *args):
+        try:
+            value = await run_in_threadpool(func, *args)
+            if self.cache_ttl:
+                self._store(key, value)
+            return value
+        finally:
+            self.in_flight.pop(key, None)
+
+    def _store(self, key: Hashable, value):
+        now = monotonic()
+        if len(self.cache) >= self.max_cached:
+            for stale in [k for k, (expires, _) in self.cache.items() if expires <= now]:
+                del self.cache[stale]
+            while len(self.cache) >= self.max_cached:
+                del self.cache[next(iter(self.cache))]
+        self.cache[key] = (now + self.cache_ttl, value)
+
+    def forget(self, key: Hashable):
+        self.cache.pop(key, None)
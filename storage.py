@@ -0,0 +1,262 @@
+import mimetypes
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional
+from fastapi import HTTPException
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import FileResponse, Response, StreamingResponse
+from config import MEDIA_BACKEND, MEDIA_ROOT, MEDIA_S3_BUCKET, MEDIA_S3_ENDPOINT, MEDIA_CHUNK_SIZE, \
+MEDIA_MAX_UPLOAD_BYTES
+
+
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def media_type_for(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first, last = int(start), int(end) if end else size - 1
+        else:
+            first, last = max(size - int(end), 0), size - 1
+    except ValueError:
+        return None
+    if first > last or first >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return first, min(last, size - 1)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def limited(chunks: AsyncIterator[bytes], max_bytes: int = MEDIA_MAX_UPLOAD_BYTES):
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadTooLarge
+        yield chunk
+
+
+class Storage:
+    async def save(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        raise NotImplementedError
+
+    def put_bytes(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_copy(self, key: str):
+        raise NotImplementedError
+
+    def response(self, key: str, range_header: Optional[str] = None) -> Response:
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str = MEDIA_ROOT):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise HTTPException(status_code=400, detail="Invalid media key")
+        return path
+
+    async def save(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        written = 0
+        try:
+            with open(partial, "wb") as file:
+                async for chunk in chunks:
+                    await run_in_threadpool(file.write, chunk)
+                    written += len(chunk)
+            os.replace(partial, path)
+        finally:
+            partial.unlink(missing_ok=True)
+        return written
+
+    def put_bytes(self, key: str, data: bytes):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        yield self.path(key)
+
+    def response(self, key: str, range_header: Optional[str] = None) -> Response:
+        # FileResponse answers Range requests itself. It would hand the file to the
+        # server via the pathsend extension, but uvicorn does not offer it, so the
+        # file is read and sent in chunks.
+        path = self.path(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(path, media_type=media_type_for(key))
+
+
+class S3Storage(Storage):
+    """Any client with the boto3 S3 API works, including FakeS3Client below."""
+
+    def __init__(self, client, bucket: str = MEDIA_S3_BUCKET):
+        self.client = client
+        self.bucket = bucket
+
+    async def save(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        upload = await run_in_threadpool(self.client.create_multipart_upload, Bucket=self.bucket, Key=key,
+                                         ContentType=media_type_for(key))
+        upload_id = upload["UploadId"]
+        parts, buffer, written = [], bytearray(), 0
+
+        async def flush():
+            part = await run_in_threadpool(self.client.upload_part, Bucket=self.bucket, Key=key,
+                                           UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(buffer))
+            parts.append({"PartNumber": len(parts) + 1, "ETag": part["ETag"]})
+            buffer.clear()
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                written += len(chunk)
+                if len(buffer) >= S3_MIN_PART_SIZE:
+                    await flush()
+            if buffer or not parts:
+                await flush()
+            await run_in_threadpool(self.client.complete_multipart_upload, Bucket=self.bucket, Key=key,
+                                    UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            await run_in_threadpool(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key,
+                                    UploadId=upload_id)
+            raise
+        return written
+
+    def put_bytes(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=media_type_for(key))
+
+    def exists(self, key: str) -> bool:
+        return self._size(key) is not None
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def _size(self, key: str) -> Optional[int]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except Exception:
+            return None
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        with tempfile.NamedTemporaryFile(suffix=Path(key).suffix) as file:
+            body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+            for chunk in body.iter_chunks(MEDIA_CHUNK_SIZE):
+                file.write(chunk)
+            file.flush()
+            yield Path(file.name)
+
+    def response(self, key: str, range_header: Optional[str] = None) -> Response:
+        size = self._size(key)
+        if size is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        byte_range = parse_range(range_header, size)
+        headers = {"Accept-Ranges": "bytes"}
+        request = {"Bucket": self.bucket, "Key": key}
+        status_code = 200
+        if byte_range is not None:
+            first, last = byte_range
+            request["Range"] = f"bytes={first}-{last}"
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+            headers["Content-Length"] = str(last - first + 1)
+            status_code = 206
+        else:
+            headers["Content-Length"] = str(size)
+        body = self.client.get_object(**request)["Body"]
+        return StreamingResponse(iterate_in_threadpool(body.iter_chunks(MEDIA_CHUNK_SIZE)),
+                                 status_code=status_code, media_type=media_type_for(key), headers=headers)
+
+
+class FakeS3Body:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+    def iter_chunks(self, chunk_size: int):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client, for local runs and tests."""
+
+    def __init__(self):
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Bucket, Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Bucket, Key] = Body
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise KeyError(Key)
+        return {"ContentLength": len(self.objects[Bucket, Key])}
+
+    def get_object(self, Bucket, Key, Range: Optional[str] = None):
+        data = self.objects[Bucket, Key]
+        if Range:
+            first, last = Range[len("bytes="):].split("-")
+            data = data[int(first):int(last) + 1]
+        return {"Body": FakeS3Body(data), "ContentLength": len(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def get_storage() -> Storage:
+    if MEDIA_BACKEND == "s3":
+        import boto3
+        return S3Storage(boto3.client("s3", endpoint_url=MEDIA_S3_ENDPOINT))
+    if MEDIA_BACKEND == "memory":
+        return S3Storage(FakeS3Client())
+    return LocalStorage()
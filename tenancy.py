@@ -0,0 +1,106 @@
+import threading
+from contextvars import ContextVar
+from typing import Hashable, Optional
+from jose import JWTError, jwt
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, with_loader_criteria
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from database import SessionLocal
+from models import Tenant, TenantScoped
+from config import SECRET_KEY, ALGORITHM, TENANT_DEFAULT_ID, TENANT_EXEMPT_PATHS
+
+
+# The school the current request belongs to; None outside requests, where
+# background jobs see every tenant.
+current_tenant: ContextVar[Optional[int]] = ContextVar("current_tenant", default=None)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def scope_to_tenant(state):
+    tenant_id = current_tenant.get()
+    if tenant_id is None or state.execution_options.get("all_tenants"):
+        return
+    if state.is_select or state.is_update or state.is_delete:
+        state.statement = state.statement.options(
+            with_loader_criteria(TenantScoped, lambda cls: cls.tenant_id == tenant_id, include_aliases=True)
+        )
+
+
+@event.listens_for(Session, "before_flush")
+def assign_tenant(db: Session, flush_context, instances):
+    tenant_id = current_tenant.get()
+    if tenant_id is None:
+        return
+    for obj in db.new:
+        if isinstance(obj, TenantScoped) and obj.tenant_id is None:
+            obj.tenant_id = tenant_id
+
+
+def tenant_key(key: Hashable) -> tuple[Optional[int], Hashable]:
+    """Cache key that cannot be served to another tenant."""
+    return current_tenant.get(), key
+
+
+def tenant_topic(topic: str) -> str:
+    """Event topic that only subscribers of the same school receive."""
+    return f"{current_tenant.get()}:{topic}"
+
+
+def token_claims(request) -> dict:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return {}
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return {}
+
+
+class TenantResolver:
+    """Host name to tenant id, kept in memory and reloaded periodically."""
+
+    def __init__(self, default: Optional[int] = TENANT_DEFAULT_ID):
+        self.default = default
+        self.lock = threading.Lock()
+        self.hosts: dict[str, int] = {}
+
+    def load(self):
+        with SessionLocal() as db:
+            hosts = dict(db.execute(select(Tenant.host, Tenant.id).where(Tenant.host.is_not(None))).all())
+        with self.lock:
+            self.hosts = {host.lower(): tenant_id for host, tenant_id in hosts.items()}
+
+    def resolve(self, request) -> Optional[int]:
+        host = request.headers.get("host", "").rsplit(":", 1)[0].lower()
+        host_tenant = self.hosts.get(host)
+        token_tenant = token_claims(request).get("tenant")
+        if host_tenant is not None and token_tenant is not None and host_tenant != token_tenant:
+            raise PermissionError
+        for tenant_id in (host_tenant, token_tenant, self.default):
+            if tenant_id is not None:
+                return tenant_id
+        return None
+
+
+class TenantMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, resolver: TenantResolver, exempt: tuple[str, ...] = TENANT_EXEMPT_PATHS):
+        super().__init__(app)
+        self.resolver = resolver
+        # Health probes arrive by IP, and the admin works across schools.
+        self.exempt = exempt
+
+    async def dispatch(self, request, call_next):
+        if request.url.path.startswith(self.exempt):
+            return await call_next(request)
+        try:
+            tenant_id = self.resolver.resolve(request)
+        except PermissionError:
+            return JSONResponse(status_code=403, content={"detail": "Token belongs to another school"})
+        if tenant_id is None:
+            return JSONResponse(status_code=404, content={"detail": "Unknown school"})
+        token = current_tenant.set(tenant_id)
+        try:
+            return await call_next(request)
+        finally:
+            current_tenant.reset(token)
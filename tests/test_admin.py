@@ -0,0 +1,34 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from admin import setup_admin
+from models import Tenant, Category
+
+
+def test_admin_create_picks_the_tenant(session_factory):
+    # The admin runs without a current tenant, so the form has to supply it.
+    with session_factory() as db:
+        db.add_all([Tenant(id=1, name="first"), Tenant(id=2, name="second")])
+        db.commit()
+    app = FastAPI()
+    setup_admin(app, session_factory.kw["bind"])
+    client = TestClient(app)
+
+    response = client.post("/admin/category/create", data={"category_name": "Math", "tenant": "2"},
+                           follow_redirects=False)
+    assert response.status_code == 302
+    with session_factory() as db:
+        assert [(category.category_name, category.tenant_id) for category in db.query(Category)] == [("Math", 2)]
+
+    # A missing tenant is a form error, not an IntegrityError.
+    response = client.post("/admin/category/create", data={"category_name": "Art"}, follow_redirects=False)
+    assert response.status_code == 400
+    with session_factory() as db:
+        assert db.query(Category).count() == 1
+
+
+def test_tenant_scoped_admin_forms_have_a_tenant_field(session_factory):
+    app = FastAPI()
+    setup_admin(app, session_factory.kw["bind"])
+    client = TestClient(app)
+    for identity in ("category", "course", "user-profile"):
+        assert 'name="tenant"' in client.get(f"/admin/{identity}/create").text
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+from decimal import Decimal
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import audit
+from audit import AuditLog, stage_flushed
+from models import Tenant, UserProfile, Course, UserRole, StatusCourse, TypeCourse
+
+
+def test_dirty_diff_holds_columns_not_related_objects(session_factory):
+    with session_factory() as db:
+        db.add(Tenant(id=1, name="school"))
+        first, second = [UserProfile(first_name="A", last_name="B", username=name, password="-",
+                                     role=UserRole.teacher, tenant_id=1) for name in ("first", "second")]
+        course = Course(course_name="Course", description="-", level=StatusCourse.level1, price=Decimal("1.00"),
+                        type_course=TypeCourse.type1, author=first, tenant_id=1)
+        db.add_all([first, second, course])
+        db.commit()
+        # Importing main installs the hook on every session already.
+        if not event.contains(Session, "after_flush", stage_flushed):
+            event.listen(db, "after_flush", stage_flushed)
+        # What sqladmin's edit form does to a freshly loaded row.
+        db.refresh(course)
+        course.author = second
+        db.flush()
+        update, = [item for item in db.info["audit"] if item["action"] == "update"]
+        assert update["changes"] == {"author_id": [first.id, second.id]}
+        json.dumps(update["changes"])
+
+
+def test_failing_batch_is_retried_then_dead_lettered(tmp_path, monkeypatch):
+    class BrokenSession:
+        def __enter__(self):
+            raise RuntimeError("database unavailable")
+
+        def __exit__(self, *args):
+            pass
+
+    monkeypatch.setattr(audit, "SessionLocal", BrokenSession)
+    log = AuditLog(batch_size=2, max_attempts=3, dead_letter_dir=str(tmp_path))
+    log.push([{"entity": "courses", "entity_id": n} for n in range(3)])
+    for _ in range(2):
+        try:
+            log.flush()
+        except RuntimeError:
+            pass
+        assert log.stats["buffered"] == 3 and log.dead_lettered == 0
+
+    try:
+        log.flush()
+    except RuntimeError:
+        pass
+    # The first batch gave up; the next one has only been tried once.
+    assert log.dead_lettered == 2 and log.stats["buffered"] == 1
+    lines = [json.loads(line) for path in tmp_path.iterdir() for line in path.read_text().splitlines()]
+    assert lines == [{"entity": "courses", "entity_id": 0}, {"entity": "courses", "entity_id": 1}]
+
+
+def test_flush_recovers_after_a_failure(tmp_path, monkeypatch):
+    written = []
+
+    class FlakySession:
+        calls = 0
+
+        def __enter__(self):
+            FlakySession.calls += 1
+            if FlakySession.calls == 1:
+                raise RuntimeError("blip")
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def execute(self, statement, rows):
+            written.extend(rows)
+
+        def commit(self):
+            pass
+
+    monkeypatch.setattr(audit, "SessionLocal", FlakySession)
+    log = AuditLog(batch_size=10, dead_letter_dir=str(tmp_path))
+    log.push([{"entity_id": 1}, {"entity_id": 2}])
+    try:
+        log.flush()
+    except RuntimeError:
+        pass
+    assert log.flush() == 2
+    assert written == [{"entity_id": 1}, {"entity_id": 2}]
+    assert log.stats == {"buffered": 0, "written": 2, "dropped": 0, "dead_lettered": 0}
+
+
+def test_overflow_wakes_the_background_flush_instead_of_writing_inline(tmp_path, monkeypatch):
+    written, threads = [], []
+
+    class RecordingSession:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def execute(self, statement, rows):
+            threads.append(threading.get_ident())
+            written.extend(rows)
+
+        def commit(self):
+            pass
+
+    async def overflow():
+        log = AuditLog(size=2, batch_size=10, dead_letter_dir=str(tmp_path))
+        task = asyncio.create_task(log.run(60))
+        await asyncio.sleep(0)
+        log.push([{"entity_id": n} for n in range(3)])
+        assert written == [] and log.stats["buffered"] == 3
+        for _ in range(100):
+            if written:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return log
+
+    monkeypatch.setattr(audit, "SessionLocal", RecordingSession)
+    log = asyncio.run(overflow())
+    assert written == [{"entity_id": n} for n in range(3)]
+    assert threads != [threading.get_ident()]
+    assert log.loop is None and log.stats["buffered"] == 0
@@ -0,0 +1,50 @@
+from certificates import CertificateIndex, code_hash
+
+
+def test_lookup_finds_added_codes_only():
+    index = CertificateIndex()
+    index.add(1, code_hash("alpha"))
+    index.add(2, code_hash("beta"))
+    index.add(2, code_hash("beta"))
+    assert len(index) == 2
+    assert index.lookup("alpha") == [1]
+    assert index.lookup("beta") == [2]
+    assert index.lookup("gamma") == []
+    index.remove(1, code_hash("alpha"))
+    assert index.lookup("alpha") == []
+    assert list(index.hashes) == sorted(index.hashes)
+
+
+def test_colliding_hashes_keep_every_candidate():
+    index = CertificateIndex()
+    digest = code_hash("shared")
+    index.add(5, digest)
+    index.add(3, digest)
+    assert sorted(index.lookup("shared")) == [3, 5]
+    index.remove(5, digest)
+    assert index.lookup("shared") == [3]
+
+
+def test_changes_during_load_are_replayed(session_factory, monkeypatch):
+    import certificates
+    monkeypatch.setattr(certificates, "SessionLocal", session_factory)
+    index = CertificateIndex()
+    original = session_factory
+
+    def racing_session():
+        # A certificate is issued on another connection while load() reads the table.
+        index.add(42, code_hash("issued-during-load"))
+        return original()
+
+    monkeypatch.setattr(certificates, "SessionLocal", racing_session)
+    index.load()
+    assert index.lookup("issued-during-load") == [42]
+    assert index.pending is None
+
+
+def test_apply_handles_bus_events():
+    index = CertificateIndex()
+    index.apply({"event": "certificate.created", "data": {"id": 9, "hash": code_hash("code")}})
+    assert index.lookup("code") == [9]
+    index.apply({"event": "certificate.deleted", "data": {"id": 9, "hash": code_hash("code")}})
+    assert index.lookup("code") == []
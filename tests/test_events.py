@@ -0,0 +1,69 @@
+import asyncio
+import json
+from events import EventBus, Hub, LocalBroker
+
+
+def test_slow_subscriber_drops_oldest_then_is_cut_off():
+    hub = Hub(queue_size=2, max_dropped=2)
+    subscriber = hub.subscribe("lessons")
+    for n in range(4):
+        hub.deliver("lessons", f"m{n}")
+    assert subscriber.dropped == 2
+    assert [subscriber.queue.get_nowait() for _ in range(2)] == ["m2", "m3"]
+    hub.deliver("lessons", "m4")
+    hub.deliver("lessons", "m5")
+    hub.deliver("lessons", "m6")
+    assert "lessons" not in hub.topics
+    assert subscriber.queue.get_nowait() == "m5"
+    assert subscriber.queue.get_nowait() is None
+
+
+def test_unsubscribe_removes_empty_topics():
+    hub = Hub()
+    subscriber = hub.subscribe("exams")
+    hub.unsubscribe("exams", subscriber)
+    assert hub.topics == {}
+    hub.deliver("exams", "nobody listens")
+
+
+def test_local_broker_fans_out_to_listeners():
+    broker = LocalBroker()
+    received = []
+
+    async def run():
+        await broker.start(lambda topic, message: received.append(("a", topic, message)))
+        await broker.start(lambda topic, message: received.append(("b", topic, message)))
+        await broker.publish("lessons", "hello")
+        await broker.stop()
+        await broker.publish("lessons", "after stop")
+
+    asyncio.run(run())
+    assert received == [("a", "lessons", "hello"), ("b", "lessons", "hello")]
+
+
+def test_bus_runs_handlers_and_keeps_internal_topics_off_the_hub():
+    bus = EventBus(LocalBroker())
+    handled = []
+    bus.on("leaderboard", lambda event: handled.append(event["data"]))
+    internal = bus.hub.subscribe("leaderboard")
+    public = bus.hub.subscribe("lessons")
+
+    async def run():
+        await bus.start()
+        await bus.publish("leaderboard", "attempt.submitted", {"student_id": 1})
+        await bus.publish("lessons", "lesson.updated", {"id": 2})
+        await bus.stop()
+
+    asyncio.run(run())
+    assert handled == [{"student_id": 1}]
+    assert internal.queue.empty()
+    assert json.loads(public.queue.get_nowait()) == {"event": "lesson.updated", "data": {"id": 2}}
+
+
+def test_failing_handler_does_not_stop_delivery():
+    bus = EventBus(LocalBroker())
+    seen = []
+    bus.on("jobs", lambda event: 1 / 0)
+    bus.on("jobs", lambda event: seen.append(event["event"]))
+    bus.dispatch("jobs", json.dumps({"event": "job.done", "data": {}}))
+    assert seen == ["job.done"]
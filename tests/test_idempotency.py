@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+import idempotency
+from idempotency import IdempotencyStore, IdempotencyMiddleware
+from models import IdempotencyKey
+
+
+class Handler:
+    def __init__(self):
+        self.calls = 0
+        self.fail_with = None
+        self.release = None
+
+    async def __call__(self, request: Request):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail_with == "error":
+            raise HTTPException(status_code=503, detail="try again")
+        if self.fail_with == "exception":
+            raise RuntimeError("handler crashed")
+        return {"call": self.calls, "body": await request.json()}
+
+
+@pytest.fixture
+def worker(session_factory, monkeypatch):
+    monkeypatch.setattr(idempotency, "SessionLocal", session_factory)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.3)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+
+    def make(handler: Handler):
+        # One worker process: its own app and in-process cache, sharing the table.
+        app = FastAPI()
+        app.add_middleware(IdempotencyMiddleware, store=IdempotencyStore())
+
+        @app.post("/orders")
+        async def create_order(request: Request):
+            return await handler(request)
+
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app, raise_app_exceptions=False),
+                                 base_url="http://test")
+    return make
+
+
+def post(client, body, key="k", path="/orders"):
+    return client.post(path, json=body, headers={"Idempotency-Key": key})
+
+
+def test_retry_replays_the_stored_response(worker):
+    handler = Handler()
+
+    async def run():
+        async with worker(handler) as client, worker(handler) as other:
+            first = await post(client, {"amount": 1})
+            again = await post(client, {"amount": 1})
+            elsewhere = await post(other, {"amount": 1})
+            return first, again, elsewhere
+
+    first, again, elsewhere = asyncio.run(run())
+    assert handler.calls == 1
+    assert again.json() == elsewhere.json() == first.json()
+    assert again.headers["idempotent-replayed"] == elsewhere.headers["idempotent-replayed"] == "true"
+
+
+def test_key_reused_for_a_different_request_is_rejected(worker):
+    handler = Handler()
+
+    async def run():
+        async with worker(handler) as client:
+            await post(client, {"amount": 1})
+            body = await post(client, {"amount": 2})
+            query = await post(client, {"amount": 1}, path="/orders?coupon=half")
+            other_key = await post(client, {"amount": 2}, key="other")
+            return body, query, other_key
+
+    body, query, other_key = asyncio.run(run())
+    assert body.status_code == query.status_code == 422
+    assert other_key.status_code == 200 and handler.calls == 2
+
+
+def test_concurrent_retries_in_one_process_run_the_handler_once(worker):
+    handler = Handler()
+
+    async def run():
+        handler.release = asyncio.Event()
+        async with worker(handler) as client:
+            requests = [asyncio.create_task(post(client, {"amount": 1})) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            handler.release.set()
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(run())
+    assert handler.calls == 1
+    assert len({response.text for response in responses}) == 1
+
+
+@pytest.mark.parametrize("failure", ["error", "exception"])
+def test_failed_request_releases_the_key(worker, session_factory, failure):
+    handler = Handler()
+
+    async def run():
+        async with worker(handler) as client:
+            handler.fail_with = failure
+            failed = await post(client, {"amount": 1})
+            handler.fail_with = None
+            retried = await post(client, {"amount": 1})
+            return failed, retried
+
+    failed, retried = asyncio.run(run())
+    assert failed.status_code >= 500
+    assert retried.status_code == 200 and handler.calls == 2
+    with session_factory() as db:
+        assert db.query(IdempotencyKey).one().status_code == 200
+
+
+def pending_row(session_factory, expires_in: float):
+    now = datetime.utcnow()
+    with session_factory() as db:
+        db.add(IdempotencyKey(key="None:None:/orders:k", fingerprint="-", created_at=now,
+                              expires_at=now + timedelta(seconds=expires_in)))
+        db.commit()
+
+
+def test_live_claim_from_another_worker_makes_the_retry_wait(worker, session_factory):
+    pending_row(session_factory, 60)
+    handler = Handler()
+
+    async def run():
+        async with worker(handler) as client:
+            return await post(client, {"amount": 1})
+
+    response = asyncio.run(run())
+    assert response.status_code == 409 and handler.calls == 0
+
+
+def test_expired_claim_is_taken_over(worker, session_factory):
+    # The worker holding the key died before its lease ran out.
+    pending_row(session_factory, -1)
+    handler = Handler()
+
+    async def run():
+        async with worker(handler) as client:
+            return await post(client, {"amount": 1})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200 and handler.calls == 1
+    with session_factory() as db:
+        row = db.query(IdempotencyKey).one()
+        assert row.status_code == 200 and row.expires_at > datetime.utcnow() + timedelta(hours=1)
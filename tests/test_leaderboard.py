@@ -0,0 +1,35 @@
+from leaderboard import Leaderboard, Leaderboards
+
+
+def test_ranks_share_ties_and_follow_updates():
+    board = Leaderboard({1: 10, 2: 30, 3: 20})
+    assert [entry["student_id"] for entry in board.top(3)] == [2, 3, 1]
+    board.set(4, 20)
+    assert board.rank(3) == board.rank(4) == 2
+    assert board.rank(1) == 4
+    board.set(1, 40)
+    assert board.rank(1) == 1 and board.rank(2) == 2
+    assert board.rank(99) is None
+
+
+def test_around_returns_neighbours():
+    board = Leaderboard({student_id: student_id * 10 for student_id in range(1, 11)})
+    window = board.around(5, 1)
+    assert [entry["student_id"] for entry in window] == [6, 5, 4]
+    assert [entry["rank"] for entry in window] == [5, 6, 7]
+    assert board.around(99, 1) == []
+    assert [entry["student_id"] for entry in board.around(10, 2)] == [10, 9, 8]
+
+
+def test_best_attempt_counts_and_course_board_sums_exams():
+    boards = Leaderboards()
+    boards.apply(exam_id=1, course_id=7, student_id=1, score=5)
+    boards.apply(exam_id=1, course_id=7, student_id=1, score=3)
+    boards.apply(exam_id=2, course_id=7, student_id=1, score=4)
+    boards.apply(exam_id=1, course_id=7, student_id=2, score=8)
+    assert boards.board("exam", 1).scores == {1: 5, 2: 8}
+    assert boards.board("course", 7).scores == {1: 9, 2: 8}
+    boards.apply(exam_id=1, course_id=7, student_id=1, score=6)
+    assert boards.board("course", 7).scores[1] == 10
+    assert boards.board("course", 7).rank(1) == 1
+    assert boards.board("exam", 99) is None
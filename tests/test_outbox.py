@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytest
+from sqlalchemy.exc import IntegrityError
+import outbox
+from models import Tenant, UserProfile, Course, Order, Payment, Enrollment, OutboxEvent, OrderStatus, \
+    PaymentStatus, UserRole, StatusCourse, TypeCourse
+from payments import FakePaymentGateway
+from config import OUTBOX_BASE_BACKOFF_SECONDS, OUTBOX_MAX_BACKOFF_SECONDS
+
+
+@pytest.fixture
+def payment_id(session_factory, monkeypatch):
+    monkeypatch.setattr(outbox, "SessionLocal", session_factory)
+    with session_factory() as db:
+        db.add(Tenant(id=1, name="school"))
+        student = UserProfile(first_name="A", last_name="B", username="student", password="-",
+                              role=UserRole.student, tenant_id=1)
+        db.add(student)
+        db.flush()
+        course = Course(course_name="Paid", description="-", level=StatusCourse.level1, price=Decimal("10.00"),
+                        type_course=TypeCourse.type2, author_id=student.id, tenant_id=1)
+        db.add(course)
+        db.flush()
+        order = Order(student_id=student.id, course_id=course.id, amount=course.price)
+        db.add(order)
+        db.flush()
+        payment = Payment(order_id=order.id)
+        db.add(payment)
+        db.flush()
+        outbox.enqueue(db, outbox.CHARGE_PAYMENT, {"payment_id": payment.id})
+        db.commit()
+        return payment.id
+
+
+def make_due(session_factory):
+    with session_factory() as db:
+        for event in db.query(OutboxEvent):
+            event.next_attempt_at = datetime.utcnow()
+        db.commit()
+
+
+def state(session_factory, payment_id):
+    with session_factory() as db:
+        payment = db.get(Payment, payment_id)
+        event = db.query(OutboxEvent).one()
+        return payment.status, payment.order.status, event, db.query(Enrollment).count()
+
+
+def test_successful_charge_pays_order_and_enrolls(session_factory, payment_id):
+    gateway = FakePaymentGateway()
+    assert outbox.drain_outbox(gateway) == 1
+    payment_status, order_status, event, enrollments = state(session_factory, payment_id)
+    assert (payment_status, order_status, enrollments) == (PaymentStatus.succeeded, OrderStatus.paid, 1)
+    assert event.processed_at is not None and event.attempts == 0
+    assert payment_id in gateway.charges
+    assert outbox.drain_outbox(gateway) == 0
+
+
+def test_failed_charge_is_retried_with_backoff(session_factory, payment_id):
+    gateway = FakePaymentGateway(failures=1)
+    before = datetime.utcnow()
+    outbox.dispatch_outbox(gateway)
+    payment_status, _, event, enrollments = state(session_factory, payment_id)
+    assert payment_status == PaymentStatus.pending and enrollments == 0
+    assert event.attempts == 1 and event.processed_at is None
+    assert event.last_error == "fake gateway unavailable"
+    assert event.next_attempt_at > before
+    assert outbox.dispatch_outbox(gateway) == 0
+
+    make_due(session_factory)
+    outbox.dispatch_outbox(gateway)
+    payment_status, order_status, event, enrollments = state(session_factory, payment_id)
+    assert (payment_status, order_status, enrollments) == (PaymentStatus.succeeded, OrderStatus.paid, 1)
+    assert event.processed_at is not None
+
+
+def test_gives_up_after_max_attempts(session_factory, payment_id, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    gateway = FakePaymentGateway(failures=10)
+    outbox.dispatch_outbox(gateway)
+    make_due(session_factory)
+    outbox.dispatch_outbox(gateway)
+    payment_status, order_status, event, enrollments = state(session_factory, payment_id)
+    assert (payment_status, order_status, enrollments) == (PaymentStatus.failed, OrderStatus.failed, 0)
+    assert event.attempts == 2 and event.processed_at is not None
+    with session_factory() as db:
+        assert db.get(Payment, payment_id).last_error == "fake gateway unavailable"
+
+
+def test_declined_charge_fails_order(session_factory, payment_id):
+    outbox.dispatch_outbox(FakePaymentGateway(status=PaymentStatus.failed))
+    payment_status, order_status, event, enrollments = state(session_factory, payment_id)
+    assert (payment_status, order_status, enrollments) == (PaymentStatus.failed, OrderStatus.failed, 0)
+    assert event.processed_at is not None
+
+
+def test_claimed_events_are_leased_while_the_gateway_is_called(session_factory, payment_id):
+    seen = []
+
+    class ReentrantGateway(FakePaymentGateway):
+        def charge(self, payment_id, amount, currency="KGS"):
+            # Another worker polling now must not pick up the same event.
+            seen.append(outbox.dispatch_outbox(FakePaymentGateway()))
+            return super().charge(payment_id, amount, currency)
+
+    outbox.dispatch_outbox(ReentrantGateway())
+    assert seen == [0]
+    assert state(session_factory, payment_id)[0] == PaymentStatus.succeeded
+
+
+def test_backoff_grows_and_is_capped():
+    assert timedelta(seconds=OUTBOX_BASE_BACKOFF_SECONDS / 2) <= outbox.backoff(1) \
+        <= timedelta(seconds=OUTBOX_BASE_BACKOFF_SECONDS)
+    assert outbox.backoff(3) >= timedelta(seconds=OUTBOX_BASE_BACKOFF_SECONDS * 2)
+    assert outbox.backoff(50) <= timedelta(seconds=OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+def test_only_one_pending_order_per_student_and_course(session_factory, payment_id):
+    with session_factory() as db:
+        first = db.query(Order).one()
+        db.add(Order(student_id=first.student_id, course_id=first.course_id, amount=first.amount))
+        with pytest.raises(IntegrityError):
+            db.flush()
+        db.rollback()
+        # Once the first order has failed, the student may check out again.
+        db.get(Order, first.id).status = OrderStatus.failed
+        db.add(Order(student_id=first.student_id, course_id=first.course_id, amount=first.amount))
+        db.commit()
+        assert db.query(Order).count() == 2
@@ -0,0 +1,61 @@
+from datetime import datetime
+from decimal import Decimal
+import pytest
+from fastapi import HTTPException
+from patch import patch_row
+from schema import LessonPatchSchema
+from models import Tenant, UserProfile, Course, Lesson, UserRole, StatusCourse, TypeCourse
+
+
+@pytest.fixture
+def db(session_factory):
+    with session_factory() as db:
+        db.add(Tenant(id=1, name="school"))
+        db.add(UserProfile(id=1, first_name="A", last_name="B", username="teacher", password="-",
+                           role=UserRole.teacher, tenant_id=1))
+        for course_id, deleted_at in ((1, None), (2, datetime.utcnow())):
+            db.add(Course(id=course_id, course_name="Course", description="-", level=StatusCourse.level1,
+                          price=Decimal("1.00"), type_course=TypeCourse.type1, author_id=1, tenant_id=1,
+                          deleted_at=deleted_at))
+            db.add(Lesson(id=course_id, title="Lesson", video_url="/video", course_id=course_id))
+        db.commit()
+        yield db
+
+
+def patch(db, lesson_id: int, **fields):
+    visible = db.query(Lesson).join(Course).filter(Course.deleted_at.is_(None))
+    return patch_row(db, Lesson, lesson_id, LessonPatchSchema(**fields), visible)
+
+
+def test_only_sent_fields_change_and_the_version_moves(db):
+    row = patch(db, 1, version=1, title="Renamed", video_url=None)
+    assert (row.title, row.video_url, row.content, row.version) == ("Renamed", None, None, 2)
+    db.expire_all()
+    assert db.get(Lesson, 1).title == "Renamed"
+
+
+def test_stale_version_is_a_conflict(db):
+    patch(db, 1, version=1, title="First")
+    with pytest.raises(HTTPException) as error:
+        patch(db, 1, version=1, title="Second")
+    assert error.value.status_code == 409
+    db.expire_all()
+    assert db.get(Lesson, 1).title == "First"
+
+
+@pytest.mark.parametrize("lesson_id", [2, 99])
+def test_missing_or_hidden_row_is_not_found(db, lesson_id):
+    # Lesson 2 belongs to a soft-deleted course.
+    with pytest.raises(HTTPException) as error:
+        patch(db, lesson_id, version=1, title="Renamed")
+    assert error.value.status_code == 404
+    db.expire_all()
+    assert db.get(Lesson, 2).title == "Lesson"
+
+
+def test_null_for_a_required_column_is_rejected(db):
+    with pytest.raises(HTTPException) as error:
+        patch(db, 1, version=1, title=None)
+    assert error.value.status_code == 422
+    db.expire_all()
+    assert db.get(Lesson, 1).version == 1
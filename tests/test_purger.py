@@ -0,0 +1,86 @@
+from datetime import datetime
+from decimal import Decimal
+import pytest
+from sqlalchemy import event
+import purger
+from purger import purge_deleted
+from models import Tenant, UserProfile, Category, Course, Lesson, Exam, Question, Certificate, Enrollment, Order, \
+    UserRole, StatusCourse, TypeCourse
+
+
+@pytest.fixture
+def db_factory(session_factory, monkeypatch):
+    monkeypatch.setattr(purger, "SessionLocal", session_factory)
+    engine = session_factory.kw["bind"]
+
+    # Enforced foreign keys make deleting a course before its dependents fail.
+    @event.listens_for(engine, "connect")
+    def enforce_foreign_keys(connection, record):
+        connection.execute("PRAGMA foreign_keys = ON")
+
+    # lock_timeout is Postgres-only; SQLite never waits on row locks anyway.
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def skip_lock_timeout(connection, cursor, statement, parameters, context, executemany):
+        return ("SELECT 1", ()) if statement.startswith("SET LOCAL lock_timeout") else (statement, parameters)
+
+    engine.dispose()
+    with session_factory() as db:
+        db.add(Tenant(id=1, name="school"))
+        db.add(UserProfile(id=1, first_name="A", last_name="B", username="student", password="-",
+                           role=UserRole.student, tenant_id=1))
+        db.commit()
+    return session_factory
+
+
+def add_course(db, deleted: bool, category=None) -> Course:
+    course = Course(course_name="Course", description="-", level=StatusCourse.level1, price=Decimal("1.00"),
+                    type_course=TypeCourse.type2, author_id=1, tenant_id=1, category=category,
+                    deleted_at=datetime.utcnow() if deleted else None)
+    db.add(course)
+    db.flush()
+    exam = Exam(title="Exam", course_id=course.id, end_time=60)
+    db.add_all([exam, Lesson(title="Lesson", course_id=course.id), Enrollment(student_id=1, course_id=course.id),
+                Certificate(student_id=1, course_id=course.id, certificate_url="/certificate")])
+    db.flush()
+    db.add_all([Question(exam_id=exam.id, title=f"Question {n}", score=1) for n in range(3)])
+    return course
+
+
+def test_dependents_go_before_the_course(db_factory):
+    with db_factory() as db:
+        doomed, live = add_course(db, deleted=True).id, add_course(db, deleted=False).id
+        db.commit()
+    # A batch of 2 makes each dependent table take more than one pass.
+    assert purge_deleted(batch_size=2) > 0
+    with db_factory() as db:
+        assert [course.id for course in db.query(Course)] == [live]
+        for model in (Lesson, Exam, Enrollment, Certificate):
+            assert [row.course_id for row in db.query(model)] == [live]
+        assert db.query(Question).count() == 3
+
+
+def test_ordered_courses_stay_soft_deleted(db_factory):
+    with db_factory() as db:
+        course = add_course(db, deleted=True)
+        db.add(Order(student_id=1, course_id=course.id, amount=course.price))
+        db.commit()
+    assert purge_deleted() == 0
+    with db_factory() as db:
+        assert db.query(Course).one().deleted_at is not None
+        assert db.query(Lesson).count() == 1
+
+
+def test_deleted_categories_are_detached_then_removed(db_factory):
+    with db_factory() as db:
+        category = Category(category_name="Old", tenant_id=1, deleted_at=datetime.utcnow())
+        kept = Category(category_name="Kept", tenant_id=1)
+        first, second = add_course(db, False, category), add_course(db, False, category)
+        add_course(db, False, kept)
+        db.commit()
+        versions = {first.id: first.version, second.id: second.version}
+    purge_deleted(batch_size=1)
+    with db_factory() as db:
+        assert [category.category_name for category in db.query(Category)] == ["Kept"]
+        courses = {course.id: course for course in db.query(Course)}
+        assert [courses[course_id].category_id for course_id in versions] == [None, None]
+        assert all(courses[course_id].version == version + 1 for course_id, version in versions.items())
@@ -0,0 +1,81 @@
+import json
+from decimal import Decimal
+import pytest
+from sqlalchemy import event, select
+import recommend
+from recommend import Recommender
+from models import Tenant, UserProfile, Course, CourseSimilarity, UserRole, StatusCourse, TypeCourse
+
+
+@pytest.fixture
+def add_course(session_factory, monkeypatch):
+    monkeypatch.setattr(recommend, "SessionLocal", session_factory)
+    # save() serialises writers with a Postgres advisory lock; SQLite has one writer anyway.
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "connect",
+                 lambda connection, record: connection.create_function("pg_advisory_xact_lock", 1, lambda key: None))
+    engine.dispose()
+    with session_factory() as db:
+        db.add(Tenant(id=1, name="school"))
+        db.add(UserProfile(id=1, first_name="A", last_name="B", username="teacher", password="-",
+                           role=UserRole.teacher, tenant_id=1))
+        db.commit()
+
+    def add(name: str) -> int:
+        with session_factory() as db:
+            course = Course(course_name=name, description=name, level=StatusCourse.level1, price=Decimal("1.00"),
+                            type_course=TypeCourse.type1, author_id=1, tenant_id=1)
+            db.add(course)
+            db.commit()
+            return course.id
+    return add
+
+
+def workers(count: int) -> list[Recommender]:
+    # Stands in for the event bus: every worker, the sender included, applies each event.
+    recommenders = []
+
+    def notify(name, data):
+        for worker in recommenders:
+            worker.apply({"event": name, "data": json.loads(json.dumps(data))})
+    recommenders.extend(Recommender(top_k=3, notify=notify) for _ in range(count))
+    return recommenders
+
+
+def saved(session_factory, course_id: int) -> list[int]:
+    with session_factory() as db:
+        return list(db.scalars(select(CourseSimilarity.similar_course_id)
+                               .where(CourseSimilarity.course_id == course_id).order_by(CourseSimilarity.rank)))
+
+
+def test_refresh_sees_courses_refreshed_by_another_worker(session_factory, add_course):
+    first = add_course("python basics")
+    add_course("cooking basics")
+    a, b = workers(2)
+    a.load_vectors()
+    b.load_vectors()
+
+    # Created after both workers loaded their vectors, and refreshed by b only.
+    third = add_course("python web")
+    b.refresh_course(third)
+    assert third in a.rows
+    assert [course_id for course_id, _ in a.similar(first)] == [third]
+
+    # a's save must keep b's course in the lists it rewrites.
+    a.refresh_course(first)
+    assert saved(session_factory, first)[0] == third
+    assert saved(session_factory, third)[0] == first
+    assert a.neighbors == b.neighbors
+
+
+def test_removal_reaches_every_worker(session_factory, add_course):
+    first = add_course("python basics")
+    second = add_course("python web")
+    a, b = workers(2)
+    a.load_vectors()
+    a.refresh_course(first)
+    assert b.similar(second) == a.similar(second) and b.similar(second)
+
+    a.remove_course(first)
+    assert b.similar(second) == [] and first not in b.neighbors
+    assert saved(session_factory, second) == []
@@ -0,0 +1,60 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+import pytest
+import retention
+from retention import RetentionPolicy, RetentionScheduler
+from models import Tenant, UserProfile, RefreshToken, UserRole
+
+
+@pytest.fixture
+def tokens(session_factory, monkeypatch):
+    monkeypatch.setattr(retention, "SessionLocal", session_factory)
+    now = datetime.utcnow()
+    with session_factory() as db:
+        db.add(Tenant(id=1, name="school"))
+        db.add(UserProfile(id=1, first_name="A", last_name="B", username="student", password="-",
+                           role=UserRole.student, tenant_id=1))
+        for days in (10, 9, 8, 0):
+            db.add(RefreshToken(token=f"token-{days}", user_id=1, created_date=now - timedelta(days=days)))
+        db.commit()
+
+
+def scheduler(tmp_path, dry_run=False, days=3):
+    policy = RetentionPolicy("refresh_token", RefreshToken, RefreshToken.created_date, days)
+    return RetentionScheduler([policy], archive_dir=str(tmp_path), batch_size=2, dry_run=dry_run)
+
+
+def remaining(session_factory) -> list[str]:
+    with session_factory() as db:
+        return [token.token for token in db.query(RefreshToken).order_by(RefreshToken.id)]
+
+
+def test_old_rows_are_archived_then_deleted_in_batches(tokens, session_factory, tmp_path):
+    jobs = scheduler(tmp_path)
+    assert jobs.enforce() == 3
+    assert remaining(session_factory) == ["token-0"]
+
+    archive = jobs.stats["refresh_token"]["last_archive"]
+    with gzip.open(archive, "rt", encoding="utf-8") as file:
+        rows = [json.loads(line) for line in file]
+    assert [row["token"] for row in rows] == ["token-10", "token-9", "token-8"]
+    assert jobs.stats["refresh_token"]["rows_moved"] == 3
+
+    # Nothing left to move: no new archive file.
+    assert jobs.enforce() == 0
+    assert jobs.stats["refresh_token"]["last_archive"] is None
+    assert len(list(tmp_path.rglob("*.ndjson.gz"))) == 1
+
+
+def test_dry_run_counts_without_touching_rows(tokens, session_factory, tmp_path):
+    jobs = scheduler(tmp_path, dry_run=True)
+    assert jobs.enforce() == 3
+    assert len(remaining(session_factory)) == 4
+    assert jobs.stats["refresh_token"]["rows_moved"] == 0 and jobs.stats["refresh_token"]["last_rows"] == 3
+    assert not list(tmp_path.rglob("*.ndjson.gz"))
+
+
+def test_disabled_policy_is_skipped(tokens, session_factory, tmp_path):
+    assert scheduler(tmp_path, days=None).enforce() == 0
+    assert len(remaining(session_factory)) == 4
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def load(key):
+        calls.append(key)
+        time.sleep(0.05)
+        return {"id": key}
+
+    async def run():
+        return await asyncio.gather(*[flight.do(1, load, 1) for _ in range(10)], flight.do(2, load, 2))
+
+    results = asyncio.run(run())
+    assert results[:10] == [{"id": 1}] * 10 and results[10] == {"id": 2}
+    assert sorted(calls) == [1, 2]
+    assert flight.stats["executions"] == 2 and flight.stats["coalesced"] == 9
+    assert flight.in_flight == {}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight(cache_ttl=60)
+    release = threading.Event()
+
+    def fail():
+        release.wait(1)
+        raise LookupError("boom")
+
+    async def run():
+        waiters = [asyncio.ensure_future(flight.do("key", fail)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    assert all(isinstance(result, LookupError) for result in asyncio.run(run()))
+    assert flight.stats["executions"] == 1
+    assert asyncio.run(flight.do("key", lambda: "ok")) == "ok"
+
+
+def test_cache_ttl_and_forget():
+    flight = SingleFlight(cache_ttl=60)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        first = await flight.do("key", load)
+        second = await flight.do("key", load)
+        flight.forget("key")
+        third = await flight.do("key", load)
+        return first, second, third
+
+    assert asyncio.run(run()) == (1, 1, 2)
+    assert flight.stats["cache_hits"] == 1
+
+
+def test_cache_is_bounded():
+    flight = SingleFlight(cache_ttl=60, max_cached=3)
+
+    async def run():
+        for key in range(5):
+            await flight.do(key, lambda value=key: value)
+
+    asyncio.run(run())
+    assert len(flight.cache) == 3
+    assert list(flight.cache) == [2, 3, 4]
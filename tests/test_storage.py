@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from storage import FakeS3Client, S3Storage, parse_range, limited, UploadTooLarge
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+async def body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_fake_s3_multipart_round_trip():
+    client = FakeS3Client()
+    upload = client.create_multipart_upload(Bucket="b", Key="k")
+    first = client.upload_part(Bucket="b", Key="k", UploadId=upload["UploadId"], PartNumber=1, Body=b"hello ")
+    second = client.upload_part(Bucket="b", Key="k", UploadId=upload["UploadId"], PartNumber=2, Body=b"world")
+    client.complete_multipart_upload(Bucket="b", Key="k", UploadId=upload["UploadId"], MultipartUpload={
+        "Parts": [{"PartNumber": 1, "ETag": first["ETag"]}, {"PartNumber": 2, "ETag": second["ETag"]}]})
+    assert client.head_object(Bucket="b", Key="k")["ContentLength"] == 11
+    assert client.get_object(Bucket="b", Key="k", Range="bytes=6-10")["Body"].read() == b"world"
+    assert client.uploads == {}
+    client.delete_object(Bucket="b", Key="k")
+    with pytest.raises(KeyError):
+        client.head_object(Bucket="b", Key="k")
+
+
+def test_s3_storage_saves_and_serves_ranges():
+    storage = S3Storage(FakeS3Client(), bucket="media")
+    assert asyncio.run(storage.save("lessons/1/content.txt", chunks(b"0123", b"456789"))) == 10
+    assert storage.exists("lessons/1/content.txt")
+
+    full = storage.response("lessons/1/content.txt")
+    assert full.status_code == 200 and full.headers["content-length"] == "10"
+    assert asyncio.run(body(full)) == b"0123456789"
+
+    partial = storage.response("lessons/1/content.txt", "bytes=2-4")
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 2-4/10"
+    assert asyncio.run(body(partial)) == b"234"
+
+
+def test_s3_storage_aborts_failed_uploads():
+    client = FakeS3Client()
+    storage = S3Storage(client, bucket="media")
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(storage.save("big", limited(chunks(b"x" * 6, b"x" * 6), max_bytes=10)))
+    assert client.uploads == {} and client.objects == {}
+
+
+def test_parse_range():
+    assert parse_range(None, 10) is None
+    assert parse_range("bytes=0-", 10) == (0, 9)
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=5-100", 10) == (5, 9)
+    assert parse_range("bytes=0-1,4-5", 10) is None
+    assert parse_range("bytes=a-b", 10) is None
+    with pytest.raises(HTTPException) as error:
+        parse_range("bytes=20-30", 10)
+    assert error.value.status_code == 416
@@ -0,0 +1,101 @@
+from decimal import Decimal
+import pytest
+from fastapi.testclient import TestClient
+import main
+import tenancy
+from models import Tenant, UserProfile, Course, Lesson, Exam, UserRole, StatusCourse, TypeCourse
+from tenancy import current_tenant
+
+
+@pytest.fixture
+def client(session_factory, monkeypatch):
+    monkeypatch.setattr(main, "SessionLocal", session_factory)
+    monkeypatch.setattr(tenancy, "SessionLocal", session_factory)
+    monkeypatch.setattr(main, "SECRET_KEY", "test")
+    monkeypatch.setattr(tenancy, "SECRET_KEY", "test")
+    # Unknown hosts are rejected instead of falling back to a default school.
+    monkeypatch.setattr(main.tenant_resolver, "default", None)
+    with session_factory() as db:
+        for tenant_id, host in ((1, "a.test"), (2, "b.test")):
+            db.add(Tenant(id=tenant_id, name=host, host=host))
+            db.add(UserProfile(id=tenant_id, first_name="A", last_name="B", username="teacher", password="-",
+                               role=UserRole.teacher, tenant_id=tenant_id))
+            db.flush()
+            db.add(Course(id=tenant_id, course_name=f"Course {host}", description="-", level=StatusCourse.level1,
+                          price=Decimal("10.00"), type_course=TypeCourse.type2, author_id=tenant_id,
+                          tenant_id=tenant_id))
+            db.flush()
+            db.add_all([Lesson(id=tenant_id, title=f"Lesson {host}", course_id=tenant_id),
+                        Exam(id=tenant_id, title=f"Exam {host}", course_id=tenant_id, end_time=60)])
+        db.commit()
+    main.tenant_resolver.load()
+    return TestClient(main.course_app)
+
+
+def on(host: str) -> dict:
+    return {"host": host}
+
+
+def test_reads_only_see_the_callers_school(client):
+    assert [course["id"] for course in client.get("/course/", headers=on("a.test")).json()] == [1]
+    assert [lesson["id"] for lesson in client.get("/lesson/", headers=on("b.test")).json()] == [2]
+    assert client.get("/course/2/", headers=on("a.test")).status_code == 404
+    assert client.get("/exam/2/", headers=on("a.test")).status_code == 404
+    assert client.get("/course/1/", headers=on("a.test")).status_code == 200
+
+
+def test_writes_cannot_reach_another_school(client, session_factory):
+    a = on("a.test")
+    lesson = {"id": 10, "title": "Injected", "course_id": 2}
+    assert client.post("/lesson_post/", json=lesson, headers=a).status_code == 404
+    assert client.post("/exam_post/", json={"id": 10, "title": "x", "course_id": 2, "end_time": 60},
+                       headers=a).status_code == 404
+    assert client.post("/question/create/", json={"id": 10, "exam_id": 2, "title": "x", "score": 1},
+                       headers=a).status_code == 404
+    assert client.patch("/lesson/1/", json={"version": 1, "course_id": 2}, headers=a).status_code == 404
+    assert client.patch("/course/2/", json={"version": 1, "course_name": "Taken"}, headers=a).status_code == 404
+    assert client.post("/course/1/checkout/", json={"student_id": 2}, headers=a).status_code == 404
+    assert [lesson["id"] for lesson in client.get("/lesson/", headers=on("b.test")).json()] == [2]
+    with session_factory() as db:
+        assert db.get(Lesson, 1).course_id == 1 and db.get(Course, 2).course_name == "Course b.test"
+
+    # The same ids within the caller's school go through.
+    assert client.post("/lesson_post/", json={**lesson, "course_id": 1}, headers=a).status_code == 200
+
+
+def test_new_rows_get_the_callers_tenant(client, session_factory):
+    response = client.post("/register/", json={"id": 0, "first_name": "New", "last_name": "Student",
+                                              "username": "student", "password": "secret", "role": "student"},
+                           headers=on("b.test"))
+    assert response.status_code == 200
+    with session_factory() as db:
+        assert db.query(UserProfile).filter(UserProfile.username == "student").one().tenant_id == 2
+
+
+def test_unknown_hosts_and_mismatched_tokens_are_rejected(client):
+    assert client.get("/course/", headers=on("c.test")).status_code == 404
+    token = main.create_access_token({"sub": "teacher", "tenant": 2})
+    response = client.get("/course/", headers={**on("a.test"), "authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_audit_log_needs_a_teacher(client):
+    token = main.create_access_token({"sub": "teacher", "tenant": 1})
+    assert client.get("/audit/", headers=on("a.test")).status_code == 401
+    response = client.get("/audit/", headers={**on("a.test"), "authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+
+def test_health_and_admin_need_no_school(client):
+    assert client.get("/health/live", headers=on("10.0.0.1")).status_code == 200
+    assert client.get("/admin/", headers=on("10.0.0.1")).status_code == 200
+
+
+def test_background_jobs_see_every_school(session_factory, client):
+    with session_factory() as db:
+        assert db.query(Course).count() == 2
+        token = current_tenant.set(1)
+        try:
+            assert [course.id for course in db.query(Course)] == [1]
+        finally:
+            current_tenant.reset(token)